@@ -0,0 +1,321 @@
+"""API de leitura do SCPE em JSON
+
+Servidor WSGI (biblioteca padrão) que roda ao lado do app Streamlit, sobre o mesmo
+scpe.db, e expõe projetos, tarefas, equipes e métricas com as consultas registradas
+em projeto.QUERIES, lidas pelas conexões somente leitura de projeto.read_snapshot().
+
+- Listas são paginadas por cursor: a resposta traz "next_cursor", que é passado em
+  ?cursor=... para obter a página seguinte (?limit=... define o tamanho, até 1000).
+- A ETag de cada resposta vem dos contadores de alteração das tabelas envolvidas
+  (table_versions); com If-None-Match igual, a resposta é 304 sem consultar os dados.
+- Respostas maiores que 1 KB são compactadas com gzip quando o cliente aceita.
+- Com a variável SCPE_API_TOKEN definida, as requisições precisam do cabeçalho
+  "Authorization: Bearer <token>".
+
+Rotas:
+    GET /projetos
+    GET /projetos/<id>/tarefas
+    GET /projetos/<id>/membros
+    GET /projetos/<id>/metricas
+    GET /tarefas
+    GET /metricas
+
+Uso:
+    python api.py --port 8502
+    python api.py --bench --seed 100000   # mede requisições por segundo em um banco populado
+"""
+import argparse
+import base64
+import gzip
+import hashlib
+import http.client
+import json
+import os
+import re
+import shutil
+import socketserver
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, APP_DIR)
+import projeto
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+GZIP_MIN_BYTES = 1024
+MAX_ID = 2 ** 63 - 1  # maior inteiro do SQLite
+
+
+class ApiError(Exception):
+    """Erro com código HTTP devolvido ao cliente"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def encode_cursor(values):
+    """Cursor opaco com as chaves da última linha da página"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, start):
+    """Chaves guardadas no cursor (ou as iniciais quando não há cursor)"""
+    if not cursor:
+        return start
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise ApiError(400, "Cursor inválido")
+    if not isinstance(values, list) or len(values) != len(start):
+        raise ApiError(400, "Cursor inválido")
+    # Cada chave tem o tipo da inicial (texto ou id inteiro dentro do limite do SQLite)
+    for value, initial in zip(values, start):
+        if type(value) is not type(initial) or (isinstance(value, int) and not 0 <= value <= MAX_ID):
+            raise ApiError(400, "Cursor inválido")
+    return values
+
+
+def fetch_rows(snapshot, name, params):
+    """Executa uma consulta do registro e devolve as linhas como dicionários"""
+    cursor = snapshot.execute(projeto.QUERIES[name], params)
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def fetch_page(snapshot, name, args, keys, start, query):
+    """Página de uma consulta paginada por chave, com o cursor da página seguinte"""
+    limit = query.get('limit', DEFAULT_LIMIT)
+    after = decode_cursor(query.get('cursor'), start)
+    rows = fetch_rows(snapshot, name, (*args, *after, limit + 1))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][key] for key in keys])
+    return {'data': rows, 'next_cursor': next_cursor}
+
+
+def list_projects(snapshot, query):
+    return fetch_page(snapshot, 'api_projetos', (), ['id'], [0], query)
+
+
+def list_tasks(snapshot, query):
+    return fetch_page(snapshot, 'api_tarefas', (), ['id'], [0], query)
+
+
+def list_project_tasks(snapshot, query, project_id):
+    # Ordenadas por início (usa o índice project_id, start_date)
+    return fetch_page(snapshot, 'api_tarefas_projeto', (project_id,), ['start_date', 'id'], ['', 0], query)
+
+
+def list_project_members(snapshot, query, project_id):
+    return fetch_page(snapshot, 'api_membros_projeto', (project_id,), ['id'], [0], query)
+
+
+def project_metrics(snapshot, query, project_id):
+    metrics = fetch_rows(snapshot, 'api_metricas_projeto', (project_id,))[0]
+    metrics['completed_tasks'] = int(metrics['completed_tasks'])
+    total, completed = metrics['total_tasks'], metrics['completed_tasks']
+    metrics['completion_rate'] = round(completed / total * 100, 1) if total else 0.0
+    return {'data': metrics}
+
+
+def system_metrics(snapshot, query):
+    return {'data': projeto.get_system_summary(snapshot)}
+
+
+# Rota -> (função, tabelas cujas alterações mudam a resposta)
+ROUTES = [
+    (re.compile(r'^/projetos/?$'), list_projects, ('projects', 'users')),
+    (re.compile(r'^/projetos/(\d+)/tarefas/?$'), list_project_tasks, ('tasks', 'users')),
+    (re.compile(r'^/projetos/(\d+)/membros/?$'), list_project_members, ('project_members', 'users')),
+    (re.compile(r'^/projetos/(\d+)/metricas/?$'), project_metrics, ('tasks',)),
+    (re.compile(r'^/tarefas/?$'), list_tasks, ('tasks', 'users')),
+    (re.compile(r'^/metricas/?$'), system_metrics, ('system_summary',)),
+]
+
+
+def parse_query(query_string):
+    """Parâmetros aceitos na query string: limit e cursor"""
+    params = {key: values[-1] for key, values in parse_qs(query_string).items()}
+    query = {}
+    if 'limit' in params:
+        try:
+            query['limit'] = int(params['limit'])
+        except ValueError:
+            raise ApiError(400, "limit deve ser um número inteiro")
+        if not 1 <= query['limit'] <= MAX_LIMIT:
+            raise ApiError(400, f"limit deve estar entre 1 e {MAX_LIMIT}")
+    if 'cursor' in params:
+        query['cursor'] = params['cursor']
+    return query
+
+
+def make_etag(snapshot, tables, path, query):
+    """ETag fraca a partir dos contadores das tabelas (lidos do mesmo snapshot dos dados)"""
+    versions = sorted(snapshot.execute(projeto.QUERIES['versoes_tabelas'], (json.dumps(tables),)).fetchall())
+    key = json.dumps([path, sorted(query.items()), versions])
+    return 'W/"' + hashlib.sha1(key.encode('utf-8')).hexdigest() + '"'
+
+
+def json_response(start_response, status, payload, environ, headers=()):
+    """Corpo JSON, compactado com gzip quando vale a pena e o cliente aceita"""
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    headers = [('Content-Type', 'application/json; charset=utf-8'), ('Vary', 'Accept-Encoding'), *headers]
+    if len(body) >= GZIP_MIN_BYTES and 'gzip' in environ.get('HTTP_ACCEPT_ENCODING', ''):
+        body = gzip.compress(body, compresslevel=5)
+        headers.append(('Content-Encoding', 'gzip'))
+    headers.append(('Content-Length', str(len(body))))
+    start_response(status, headers)
+    return [b''] if environ['REQUEST_METHOD'] == 'HEAD' else [body]
+
+
+def application(environ, start_response):
+    """Aplicação WSGI da API de leitura"""
+    try:
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            raise ApiError(405, "Somente leitura: use GET")
+
+        token = os.environ.get('SCPE_API_TOKEN')
+        if token and environ.get('HTTP_AUTHORIZATION') != f"Bearer {token}":
+            raise ApiError(401, "Token ausente ou inválido")
+
+        path = environ.get('PATH_INFO', '')
+        for pattern, handler, tables in ROUTES:
+            match = pattern.match(path)
+            if match:
+                break
+        else:
+            raise ApiError(404, "Rota não encontrada")
+
+        query = parse_query(environ.get('QUERY_STRING', ''))
+        args = [int(value) for value in match.groups()]
+        if any(arg > MAX_ID for arg in args):
+            raise ApiError(404, "Projeto não encontrado")
+
+        with projeto.read_snapshot() as snapshot:
+            etag = make_etag(snapshot, tables, path, query)
+            if etag in [tag.strip() for tag in environ.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+                start_response('304 Not Modified', [('ETag', etag), ('Vary', 'Accept-Encoding')])
+                return [b'']
+            payload = handler(snapshot, query, *args)
+
+        return json_response(start_response, '200 OK', payload, environ,
+                             [('ETag', etag), ('Cache-Control', 'no-cache')])
+    except ApiError as e:
+        return json_response(start_response, f"{e.status} {http.client.responses[e.status]}",
+                             {'erro': str(e)}, environ)
+    except sqlite3.OperationalError as e:
+        # Tempo de consulta esgotado ou pool de leitura ocupado
+        return json_response(start_response, '503 Service Unavailable', {'erro': str(e)}, environ)
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def request(port, path, headers):
+    """Faz uma requisição e devolve (status, cabeçalhos, tempo em ms)"""
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('GET', path, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.status, dict(response.getheaders()), (time.perf_counter() - start) * 1000
+
+
+def bench(port, path, headers, total, clients):
+    """Requisições por segundo e latências com vários clientes simultâneos"""
+    latencies, statuses = [], []
+    lock = threading.Lock()
+    per_client = total // clients
+
+    def client():
+        for _ in range(per_client):
+            status, _, elapsed = request(port, path, headers)
+            with lock:
+                latencies.append(elapsed)
+                statuses.append(status)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - start
+
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return len(latencies) / wall_time, p50, p99, sorted(set(statuses))
+
+
+def run_bench(args):
+    """Mede a API em um servidor local: respostas completas (gzip) e revalidações 304"""
+    workdir = None
+    if args.seed:
+        import planos
+        workdir = tempfile.mkdtemp(prefix='scpe-api-')
+        os.chdir(workdir)
+        planos.seed_database(projeto, args.seed)
+
+    server = make_server('127.0.0.1', 0, application, server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    print(f"\n{'rota':<34}{'cenário':<12}{'req/s':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}{'bytes':>10}  status")
+    for path in args.paths:
+        status, headers, _ = request(port, path, {'Accept-Encoding': 'gzip'})
+        size = headers.get('Content-Length', '0')
+        scenarios = [('200 gzip', {'Accept-Encoding': 'gzip'}),
+                     ('304', {'Accept-Encoding': 'gzip', 'If-None-Match': headers.get('ETag', '')})]
+        for name, request_headers in scenarios:
+            rps, p50, p99, statuses = bench(port, path, request_headers, args.requests, args.clients)
+            print(f"{path:<34}{name:<12}{rps:>10.0f}{p50:>10.2f}{p99:>10.2f}"
+                  f"{size if name != '304' else '0':>10}  {statuses}")
+
+    server.shutdown()
+    if workdir:
+        os.chdir(APP_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API de leitura do SCPE em JSON")
+    parser.add_argument('--host', default='127.0.0.1', help="endereço de escuta")
+    parser.add_argument('--port', type=int, default=8502, help="porta de escuta")
+    parser.add_argument('--bench', action='store_true', help="mede requisições por segundo em vez de servir")
+    parser.add_argument('--seed', type=int, default=0, help="no --bench, popula um banco temporário com N tarefas")
+    parser.add_argument('--requests', type=int, default=2000, help="no --bench, requisições por cenário")
+    parser.add_argument('--clients', type=int, default=8, help="no --bench, clientes simultâneos")
+    parser.add_argument('--paths', nargs='+', default=['/projetos?limit=100', '/projetos/1/tarefas?limit=100',
+                                                       '/projetos/1/metricas', '/tarefas?limit=1000'],
+                        help="no --bench, rotas medidas")
+    args = parser.parse_args()
+
+    if args.bench:
+        run_bench(args)
+        return
+
+    projeto.init_db()
+    server = make_server(args.host, args.port, application, server_class=ThreadingWSGIServer)
+    print(f"API de leitura do SCPE em http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Teste de carga do SCPE
+
+Executa várias sessões simultâneas do projeto.py com o AppTest do Streamlit
+(uma por processo, pois o AppTest não pode rodar em várias threads do mesmo
+processo), cada uma percorrendo a jornada login -> dashboard -> atualização de tarefa ->
+envio de mensagem -> relatório, contra um banco SQLite populado em uma pasta
+temporária. Ao final mostra a vazão, as latências p50/p95/p99 por ação e a
+taxa de erros de trava (database is locked / busy) do SQLite.
+
+Uso:
+    python carga.py --sessions 8 --iterations 5
+"""
+import argparse
+import datetime
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'projeto.py')
+PASSWORD = 'senha123'
+ACTIONS = ['login', 'dashboard', 'tarefa', 'mensagem', 'relatorio']
+
+
+def seed_database(users, projects, tasks):
+    """Popula o scpe.db da pasta atual com usuários, projetos, equipes e tarefas"""
+    sys.path.insert(0, os.path.dirname(APP_PATH))
+    import projeto
+
+    projeto.init_db()
+    conn = sqlite3.connect('scpe.db')
+    c = conn.cursor()
+
+    hashed_password = projeto.hash_password(PASSWORD)
+    c.executemany("INSERT INTO users (username, password, email, role, full_name) VALUES (?, ?, ?, ?, ?)",
+                  [(f"usuario{i}", hashed_password, f"usuario{i}@scpe.local",
+                    'gerente' if i % 10 == 0 else 'membro', f"Usuário {i}")
+                   for i in range(1, users + 1)])
+
+    c.executemany("""INSERT INTO projects (name, description, client, budget, total_deadline, manager_id)
+                     VALUES (?, ?, ?, ?, ?, ?)""",
+                  [(f"Projeto {i}", "Projeto de carga", "Cliente", 10000.0, '2030-12-31',
+                    random.randint(1, users))
+                   for i in range(1, projects + 1)])
+
+    # Todo usuário participa de pelo menos um projeto
+    c.executemany("INSERT OR IGNORE INTO project_members (project_id, user_id, role) VALUES (?, ?, 'Desenvolvedor')",
+                  [((user_id - 1) % projects + 1, user_id) for user_id in range(1, users + 1)])
+
+    today = datetime.date.today()
+    c.executemany("""INSERT INTO tasks (project_id, description, start_date, end_date, status, assigned_to)
+                     VALUES (?, ?, ?, ?, 'pendente', ?)""",
+                  [((i - 1) % projects + 1, f"Tarefa {i}", str(today), str(today + datetime.timedelta(days=14)),
+                    random.randint(1, users))
+                   for i in range(1, tasks + 1)])
+
+    conn.commit()
+    conn.close()
+
+
+def is_lock_error(message):
+    """Indica se a mensagem é um erro de trava do SQLite"""
+    message = message.lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def collect_errors(at):
+    """Obtém as exceções e mensagens de erro exibidas na última execução"""
+    return [str(e.value) for e in at.exception] + [e.value for e in at.error]
+
+
+def navigate(at, page):
+    """Seleciona uma página no menu lateral"""
+    at.sidebar.selectbox[0].set_value(page).run()
+
+
+def run_session(workdir, session_id, iterations, timeout):
+    """Executa a jornada completa repetidas vezes em uma sessão do app e devolve as medições"""
+    os.chdir(workdir)
+    random.seed(session_id)
+    results = []
+    username = f"usuario{session_id + 1}"
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+    def login():
+        at.run()
+        at.text_input[0].input(username)
+        at.text_input[1].input(PASSWORD)
+        at.button[0].click().run()
+
+    def dashboard():
+        navigate(at, "📈 Dashboard")
+
+    def update_task():
+        navigate(at, "✅ Tarefas")
+        status_boxes = [box for box in at.selectbox if box.key and box.key.startswith('status_')]
+        if status_boxes:
+            box = random.choice(status_boxes)
+            box.set_value(random.choice(["pendente", "em andamento", "concluída"]))
+            at.button(key=box.key.replace('status_', 'update_')).click().run()
+
+    def send_message():
+        navigate(at, "💬 Comunicação")
+        at.text_area[0].input(f"Mensagem de carga da sessão {session_id} em {time.time():.3f}")
+        # O botão de envio do formulário (a página também pode ter o de carregar mensagens anteriores)
+        next(button for button in at.button if button.label == "Enviar Mensagem").click().run()
+
+    def report():
+        navigate(at, "📊 Relatórios")
+
+    journey = [('login', login), ('dashboard', dashboard), ('tarefa', update_task),
+               ('mensagem', send_message), ('relatorio', report)]
+
+    for _ in range(iterations):
+        for action, step in journey:
+            start = time.perf_counter()
+            try:
+                step()
+                errors = collect_errors(at)
+            except Exception as e:
+                errors = [str(e)]
+            elapsed = time.perf_counter() - start
+
+            results.append((action, elapsed, errors))
+
+        # Sai para a próxima iteração começar pelo login
+        at.session_state['user'] = None
+
+    return results
+
+
+def print_report(results, wall_time, sessions):
+    """Mostra vazão, latências por ação e taxas de erro"""
+    print(f"\nSessões simultâneas: {sessions}")
+    print(f"Ações executadas: {len(results)} em {wall_time:.1f} s "
+          f"({len(results) / wall_time:.2f} ações/s)")
+
+    print(f"\n{'ação':<12}{'n':>6}{'p50 (ms)':>12}{'p95 (ms)':>12}{'p99 (ms)':>12}{'trava':>8}{'outros':>8}")
+    for action in ACTIONS:
+        rows = [row for row in results if row[0] == action]
+        if not rows:
+            continue
+        latencies = np.array([elapsed for _, elapsed, _ in rows]) * 1000
+        lock_errors = sum(any(is_lock_error(e) for e in errors) for _, _, errors in rows)
+        other_errors = sum(bool(errors) and not any(is_lock_error(e) for e in errors) for _, _, errors in rows)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"{action:<12}{len(rows):>6}{p50:>12.0f}{p95:>12.0f}{p99:>12.0f}{lock_errors:>8}{other_errors:>8}")
+
+    lock_errors = sum(any(is_lock_error(e) for e in errors) for _, _, errors in results)
+    print(f"\nTaxa de erros de trava do SQLite: {lock_errors / len(results) * 100:.2f}%")
+
+    messages = sorted({e for _, _, errors in results for e in errors})
+    if messages:
+        print("\nErros encontrados:")
+        for message in messages[:10]:
+            print(f"  - {message[:200]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do SCPE com sessões simultâneas do AppTest")
+    parser.add_argument('--sessions', type=int, default=8, help="sessões simultâneas")
+    parser.add_argument('--iterations', type=int, default=3, help="repetições da jornada por sessão")
+    parser.add_argument('--users', type=int, default=50, help="usuários no banco populado")
+    parser.add_argument('--projects', type=int, default=10, help="projetos no banco populado")
+    parser.add_argument('--tasks', type=int, default=100, help="tarefas no banco populado")
+    parser.add_argument('--timeout', type=float, default=60, help="tempo máximo de cada execução do app (s)")
+    parser.add_argument('--keep', action='store_true', help="mantém a pasta com o banco ao final")
+    args = parser.parse_args()
+
+    if args.sessions > args.users:
+        parser.error("--sessions não pode ser maior que --users (cada sessão usa um usuário)")
+
+    # O app usa scpe.db na pasta atual: a carga roda em uma pasta temporária
+    workdir = tempfile.mkdtemp(prefix='scpe-carga-')
+    os.chdir(workdir)
+    print(f"Banco de carga: {os.path.join(workdir, 'scpe.db')}")
+
+    random.seed(42)
+    seed_database(args.users, args.projects, args.tasks)
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.sessions, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [executor.submit(run_session, workdir, session_id, args.iterations, args.timeout)
+                   for session_id in range(args.sessions)]
+        for future in futures:
+            results.extend(future.result())
+    wall_time = time.perf_counter() - start
+
+    print_report(results, wall_time, args.sessions)
+
+    os.chdir(os.path.dirname(APP_PATH))
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Verificação dos planos de execução das consultas do SCPE
+
+Popula bancos de tamanhos diferentes em pastas temporárias, roda EXPLAIN QUERY PLAN
+em cada consulta registrada em projeto.QUERIES e mede o tempo de execução de cada
+uma. Falha (código de saída 1) quando uma consulta passa a varrer uma tabela grande
+sem que isso seja esperado, ou quando monta uma B-tree temporária (ORDER BY / GROUP BY
+sem índice) que não aparecia nos planos de referência gravados em planos_base.json.
+
+Uso:
+    python planos.py                      # verifica nos tamanhos padrão
+    python planos.py --sizes 1000 100000  # tarefas por banco
+    python planos.py --update-baseline    # grava os planos atuais como referência
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(APP_DIR, 'planos_base.json')
+
+# Tabelas que crescem com o uso: varrê-las inteiras é uma regressão
+LARGE_TABLES = {'tasks', 'projects', 'messages', 'task_events', 'time_entries', 'project_members',
+                'project_visibility', 'users', 'due_date_digests', 'task_daily_buckets', 'message_archive'}
+
+# Em bancos pequenos o SQLite prefere varrer a tabela mesmo com índice disponível:
+# as varreduras só são verificadas a partir deste número de tarefas
+SCAN_CHECK_MIN_TASKS = 10000
+
+# Consultas que leem a tabela inteira de propósito
+EXPECTED_SCANS = {
+    'projetos_todos': {'projects'},
+    'api_projetos': {'projects'},
+    'tarefas_todas': {'tasks'},
+    'usuarios': {'users'},
+    'capacidade_tarefas': {'tasks'},
+    'capacidade_assinaturas': {'tasks'},
+}
+
+SQL_KEYWORDS = {'WHERE', 'JOIN', 'LEFT', 'INNER', 'CROSS', 'ON', 'ORDER', 'GROUP', 'LIMIT', 'UNION', 'USING'}
+
+# Preenchimento dos trechos variáveis das consultas: todas as colunas e todos os JOINs
+TEMPLATE_VALUES = {
+    'projetos_visiveis': {'select': 'PROJECT', 'joins': "LEFT JOIN users u ON p.manager_id = u.id"},
+    'projetos_todos': {'select': 'PROJECT', 'joins': "LEFT JOIN users u ON p.manager_id = u.id"},
+    'tarefas_projeto': {'select': 'TASK', 'joins': "LEFT JOIN users u ON t.assigned_to = u.id\n"
+                                                   "LEFT JOIN projects p ON t.project_id = p.id"},
+    'tarefas_todas': {'select': 'TASK', 'joins': "LEFT JOIN users u ON t.assigned_to = u.id\n"
+                                                 "LEFT JOIN projects p ON t.project_id = p.id"},
+    'tarefas_responsavel': {'select': 'TASK', 'joins': "LEFT JOIN users u ON t.assigned_to = u.id\n"
+                                                       "LEFT JOIN projects p ON t.project_id = p.id"},
+    'nomes_usuarios': {'placeholders': '?,?,?'},
+}
+
+
+def sample_params(name, sizes):
+    """Parâmetros de exemplo de cada consulta (usuário, projeto e período existentes)"""
+    today = datetime.date.today()
+    month_ago, month_ahead = str(today - datetime.timedelta(days=30)), str(today + datetime.timedelta(days=30))
+    params = {
+        'autenticar_usuario': ('usuario1', 'x'),
+        'projetos_visiveis': (1, False),
+        'projetos_todos': (False,),
+        'membros_projeto': (1,),
+        'membro_do_projeto': (1, 1),
+        'membros_equipe': (1,),
+        'nomes_usuarios': (1, 2, 3),
+        'tarefas_projeto': (1,),
+        'tarefas_todas': (),
+        'tarefas_responsavel': (1,),
+        'atualizar_status_tarefa': ('pendente', 0),
+        'usuarios': (),
+        'buscar_usuarios': {'low': 'Usu', 'high': 'Usu\U0010ffff', 'project_id': 1, 'limit': 10},
+        'equipes_usuario': (1,),
+        'ultimas_mensagens': (1, 0, 200),
+        'mensagens_novas': (1, sizes['messages'] - 10),
+        'mensagens_anteriores': (1, sizes['messages'] // 2, 50),
+        'arquivo_mensagens_existe': (1,),
+        'blocos_arquivo_mensagens': (1, sizes['messages']),
+        'lancamentos_usuario': (1, month_ago, str(today)),
+        'horas_por_periodo': ('%Y-%W', 1, month_ago, str(today)),
+        'fluxo_projeto': (1,),
+        'cronograma_projeto': {'project_id': 1, 'window_start': month_ago, 'window_end': month_ahead},
+        'prazos_usuario': (1,),
+        'capacidade_tarefas': (),
+        'capacidade_tarefas_usuarios': (json.dumps([1, 2, 3]),),
+        'capacidade_assinaturas': (),
+        'versoes_tabelas': (json.dumps(['tasks', 'users']),),
+        'api_projetos': (0, 100),
+        'api_tarefas': (sizes['tasks'] // 2, 100),
+        'api_tarefas_projeto': (1, str(today), 0, 100),
+        'api_membros_projeto': (1, 0, 100),
+        'api_metricas_projeto': (1,),
+    }
+    return params[name]
+
+
+def build_queries(projeto):
+    """Consultas do registro com os trechos variáveis preenchidos"""
+    columns = {'PROJECT': projeto.select_columns(None, projeto.PROJECT_COLUMNS),
+               'TASK': projeto.select_columns(None, projeto.TASK_COLUMNS)}
+    queries = {}
+    for name, sql in projeto.QUERIES.items():
+        values = {key: columns.get(value, value) for key, value in TEMPLATE_VALUES.get(name, {}).items()}
+        queries[name] = sql.format(**values) if values else sql
+    return queries
+
+
+def seed_database(projeto, tasks):
+    """Popula o scpe.db da pasta atual com dados proporcionais ao número de tarefas"""
+    sizes = {'tasks': tasks, 'users': max(20, tasks // 50), 'projects': max(5, tasks // 200),
+             'messages': tasks, 'time_entries': tasks}
+    projeto.init_db()
+    conn = sqlite3.connect('scpe.db')
+    c = conn.cursor()
+    today = datetime.date.today()
+
+    c.executemany("INSERT INTO users (username, password, email, role, full_name) VALUES (?, 'x', ?, ?, ?)",
+                  [(f"usuario{i}", f"usuario{i}@scpe.local", 'gerente' if i % 10 == 1 else 'membro',
+                    f"Usuário {i}") for i in range(1, sizes['users'] + 1)])
+    c.executemany("""INSERT INTO projects (name, description, client, budget, total_deadline, manager_id)
+                     VALUES (?, 'Projeto', 'Cliente', 1000.0, '2030-12-31', ?)""",
+                  [(f"Projeto {i}", random.randint(1, sizes['users'])) for i in range(1, sizes['projects'] + 1)])
+    c.executemany("INSERT OR IGNORE INTO project_members (project_id, user_id, role) VALUES (?, ?, 'Desenvolvedor')",
+                  [(random.randint(1, sizes['projects']), user_id)
+                   for user_id in range(1, sizes['users'] + 1) for _ in range(3)])
+
+    rows = []
+    for i in range(sizes['tasks']):
+        start = today + datetime.timedelta(days=random.randint(-200, 200))
+        rows.append((random.randint(1, sizes['projects']), f"Tarefa {i}", str(start),
+                     str(start + datetime.timedelta(days=random.randint(0, 30))),
+                     random.choice(["pendente", "em andamento", "concluída"]), random.randint(1, sizes['users'])))
+    c.executemany("""INSERT INTO tasks (project_id, description, start_date, end_date, status, assigned_to)
+                     VALUES (?, ?, ?, ?, ?, ?)""", rows)
+    c.execute("""INSERT INTO task_events (task_id, project_id, status, hours_worked, changed_by)
+                 SELECT id, project_id, status, 0, assigned_to FROM tasks""")
+    c.executemany("INSERT INTO messages (project_id, from_user, message) VALUES (?, ?, ?)",
+                  [(random.randint(1, sizes['projects']), random.randint(1, sizes['users']), f"Mensagem {i}")
+                   for i in range(sizes['messages'])])
+    c.executemany("INSERT INTO time_entries (task_id, user_id, day, hours) VALUES (?, ?, ?, ?)",
+                  [(random.randint(1, sizes['tasks']), random.randint(1, sizes['users']),
+                    str(today - datetime.timedelta(days=random.randint(0, 365))), 1.0)
+                   for _ in range(sizes['time_entries'])])
+    conn.commit()
+    conn.close()
+
+    # Mesmo estado das tabelas auxiliares e das estatísticas que o agendador mantém
+    projeto.refresh_task_buckets()
+    projeto.refresh_due_date_digests()
+    projeto.run_analyze()
+    return sizes
+
+
+def table_aliases(sql):
+    """Apelidos usados na consulta (FROM tasks t) -> nome da tabela"""
+    aliases = {}
+    for table, alias in re.findall(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.IGNORECASE):
+        aliases[table] = table
+        if alias and alias.upper() not in SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def plan_issues(name, sql, plan):
+    """Varreduras inesperadas de tabelas grandes e B-trees temporárias do plano"""
+    aliases = table_aliases(sql)
+    scans, temp_btrees = [], []
+    for detail in plan:
+        words = detail.split()
+        if words[0] in ('SCAN', 'SEARCH') and len(words) > 1:
+            # Versões antigas do SQLite escrevem "SCAN TABLE tasks"
+            table = words[2] if words[1] == 'TABLE' and len(words) > 2 else words[1]
+            table = aliases.get(table, table)
+            # Um índice automático é montado lendo a tabela inteira a cada execução
+            full_read = words[0] == 'SCAN' or 'AUTOMATIC' in detail
+            if full_read and table in LARGE_TABLES and table not in EXPECTED_SCANS.get(name, set()):
+                scans.append(detail)
+        if 'TEMP B-TREE' in detail:
+            temp_btrees.append(detail)
+    return scans, temp_btrees
+
+
+def measure(conn, sql, params, repeat):
+    """Mediana do tempo (ms) de execução completa da consulta"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+        conn.rollback()
+    return float(np.median(timings))
+
+
+def check_size(projeto, tasks, repeat):
+    """Plano e tempo de cada consulta em um banco com o número de tarefas pedido"""
+    sizes = seed_database(projeto, tasks)
+    queries = build_queries(projeto)
+    conn = sqlite3.connect('scpe.db')
+    results = {}
+    for name, sql in queries.items():
+        params = sample_params(name, sizes)
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        results[name] = {'sql': sql, 'plan': plan, 'ms': measure(conn, sql, params, repeat)}
+    conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verificação dos planos de execução das consultas do SCPE")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="tarefas em cada banco populado")
+    parser.add_argument('--repeat', type=int, default=5, help="execuções por consulta para medir o tempo")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="grava as B-trees temporárias atuais como referência")
+    parser.add_argument('--verbose', action='store_true', help="mostra o plano completo de cada consulta")
+    args = parser.parse_args()
+
+    sys.path.insert(0, APP_DIR)
+    import projeto
+
+    random.seed(42)
+    by_size = {}
+    for tasks in args.sizes:
+        # O app usa scpe.db na pasta atual: cada tamanho roda em uma pasta temporária
+        workdir = tempfile.mkdtemp(prefix='scpe-planos-')
+        os.chdir(workdir)
+        try:
+            by_size[tasks] = check_size(projeto, tasks, args.repeat)
+        finally:
+            os.chdir(APP_DIR)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    names = list(projeto.QUERIES)
+    current_btrees = {name: sorted({detail for results in by_size.values()
+                                    for detail in plan_issues(name, results[name]['sql'], results[name]['plan'])[1]})
+                      for name in names}
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(current_btrees, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Referência gravada em {BASELINE_PATH}")
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    header = ''.join(f"{f'{tasks} (ms)':>14}" for tasks in args.sizes)
+    print(f"\n{'consulta':<30}{header}  situação")
+    failures = []
+    for name in names:
+        problems = []
+        for tasks, results in by_size.items():
+            scans, temp_btrees = plan_issues(name, results[name]['sql'], results[name]['plan'])
+            if tasks >= SCAN_CHECK_MIN_TASKS:
+                problems += [f"varredura com {tasks} tarefas: {detail}" for detail in scans]
+            problems += [f"B-tree temporária nova com {tasks} tarefas: {detail}" for detail in temp_btrees
+                         if detail not in baseline.get(name, [])]
+        problems = list(dict.fromkeys(problems))
+
+        timings = ''.join(f"{by_size[tasks][name]['ms']:>14.2f}" for tasks in args.sizes)
+        print(f"{name:<30}{timings}  {'FALHA' if problems else 'ok'}")
+        if args.verbose:
+            for detail in by_size[args.sizes[-1]][name]['plan']:
+                print(f"{'':<4}{detail}")
+        failures += [(name, problem) for problem in problems]
+
+    if failures:
+        print("\nRegressões encontradas:")
+        for name, problem in failures:
+            print(f"  - {name}: {problem}")
+        sys.exit(1)
+    print("\nNenhuma regressão de plano encontrada")
+
+
+if __name__ == "__main__":
+    main()
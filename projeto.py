@@ -1,11 +1,19 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import altair as alt
 import datetime
 import hashlib
 import time
 from datetime import timedelta
 import sqlite3
 import os
+import threading
+import difflib
+import json
+import zlib
+import contextlib
+import queue
 
 # Configuração da página
 st.set_page_config(
@@ -15,12 +23,70 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Intervalo (segundos) entre consultas de mensagens novas no chat
+CHAT_POLL_INTERVAL = 3
+# Quantidade de mensagens carregadas na primeira abertura do chat de um projeto
+CHAT_INITIAL_LIMIT = 200
+# Mensagens novas redesenhadas pela atualização automática antes de uma execução
+# completa da página incorporá-las ao histórico
+CHAT_LIVE_MAX_MESSAGES = 50
+
+# Mensagens com mais dias que isso vão para o arquivo compactado; ao rolar o
+# histórico, as anteriores são carregadas em blocos deste tamanho
+MESSAGE_ARCHIVE_DAYS = 180
+MESSAGE_PAGE_SIZE = 50
+
+# Backups: pasta, páginas copiadas por passo, pausa entre passos (segundos, feita
+# no callback de progresso para dar vez às escritas), intervalo entre snapshots
+# agendados (horas) e quantidade de snapshots mantidos
+BACKUP_DIR = 'backups'
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.005
+BACKUP_INTERVAL_HOURS = 24
+BACKUP_RETENTION = 7
+
+# Tabelas de dados que podem ser restauradas sozinhas; as derivadas delas (visibilidade,
+# baldes diários, resumos, alertas) são recalculadas após a restauração
+RESTORABLE_TABLES = ('users', 'projects', 'project_members', 'tasks', 'messages', 'message_archive',
+                     'task_events', 'time_entries')
+
+# Agendador: intervalo entre verificações (segundos) e tempo após o qual
+# uma execução sem término é considerada abandonada
+SCHEDULER_TICK = 15
+SCHEDULER_LEASE_TIMEOUT = 6 * 3600
+
+# Leituras pesadas (relatórios, dashboard, administração): conexões somente leitura
+# mantidas entre execuções e tempo máximo (segundos) de cada consulta
+READ_POOL_SIZE = 4
+READ_STATEMENT_TIMEOUT = 30
+
+# Tabelas com contador de alterações (mantido por triggers), usado nas ETags da API de leitura
+VERSIONED_TABLES = ('users', 'projects', 'project_members', 'tasks', 'system_summary')
+
+# Quantidade máxima de sugestões na busca de usuários
+USER_SEARCH_LIMIT = 10
+
+# Cronograma: níveis de zoom e limites do que é enviado ao gráfico
+TIMELINE_ZOOM_LEVELS = ["Dia", "Semana", "Mês"]
+TIMELINE_MAX_BUCKETS = 120
+TIMELINE_MAX_LANES = 25
+
+# Capacidade: horas disponíveis por dia útil, esforço previsto por dia útil de tarefa
+# (as tarefas não têm estimativa própria), horizonte da previsão e pessoas no gráfico
+CAPACITY_HOURS_PER_DAY = 8.0
+TASK_HOURS_PER_DAY = 4.0
+CAPACITY_HORIZON_DAYS = 730
+CAPACITY_MAX_USERS = 25
+
 # Sistema de autenticação
 def init_db():
     """Inicializa o banco de dados SQLite"""
     conn = sqlite3.connect('scpe.db')
     c = conn.cursor()
     
+    # WAL: leitores (inclusive backups) não bloqueiam as escritas
+    c.execute("PRAGMA journal_mode=WAL")
+    
     # Verificar se a tabela users existe e tem as colunas corretas
     c.execute("PRAGMA table_info(users)")
     columns = [column[1] for column in c.fetchall()]
@@ -28,6 +94,17 @@ def init_db():
     # Se a tabela não existe ou não tem as colunas corretas, recriar
     if not columns or 'username' not in columns:
         # Drop tables if they exist
+        c.execute("DROP TABLE IF EXISTS table_versions")
+        c.execute("DROP TABLE IF EXISTS due_date_digests")
+        c.execute("DROP TABLE IF EXISTS system_summary")
+        c.execute("DROP TABLE IF EXISTS project_summary")
+        c.execute("DROP TABLE IF EXISTS project_visibility")
+        c.execute("DROP TABLE IF EXISTS time_entries")
+        c.execute("DROP TABLE IF EXISTS report_cursors")
+        c.execute("DROP TABLE IF EXISTS task_daily_buckets")
+        c.execute("DROP TABLE IF EXISTS task_status_snapshot")
+        c.execute("DROP TABLE IF EXISTS task_events")
+        c.execute("DROP TABLE IF EXISTS message_archive")
         c.execute("DROP TABLE IF EXISTS messages")
         c.execute("DROP TABLE IF EXISTS tasks")
         c.execute("DROP TABLE IF EXISTS project_members")
@@ -85,9 +162,206 @@ def init_db():
                       message TEXT,
                       created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
     
+    # Tabelas já existentes (as criadas agora recebem os dados anteriores a elas)
+    c.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    existing_tables = {row[0] for row in c.fetchall()}
+    
+    # Mensagens antigas: um bloco compactado (zlib + JSON) por projeto e mês
+    c.execute('''CREATE TABLE IF NOT EXISTS message_archive
+                 (project_id INTEGER,
+                  month TEXT,
+                  first_id INTEGER,
+                  last_id INTEGER,
+                  message_count INTEGER,
+                  payload BLOB,
+                  PRIMARY KEY (project_id, month))''')
+    
+    # Histórico de alterações de tarefas (somente inserção)
+    c.execute('''CREATE TABLE IF NOT EXISTS task_events
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  task_id INTEGER,
+                  project_id INTEGER,
+                  status TEXT,
+                  hours_worked REAL,
+                  changed_by INTEGER,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    
+    # Último status processado de cada tarefa (usado para calcular as transições)
+    c.execute('''CREATE TABLE IF NOT EXISTS task_status_snapshot
+                 (task_id INTEGER PRIMARY KEY,
+                  project_id INTEGER,
+                  status TEXT)''')
+    
+    # Baldes diários por status: variação do número de tarefas e entradas no status
+    c.execute('''CREATE TABLE IF NOT EXISTS task_daily_buckets
+                 (project_id INTEGER,
+                  day DATE,
+                  status TEXT,
+                  net_change INTEGER DEFAULT 0,
+                  entered INTEGER DEFAULT 0,
+                  PRIMARY KEY (project_id, day, status))''')
+    
+    # Posição até onde cada processamento incremental já leu
+    c.execute('''CREATE TABLE IF NOT EXISTS report_cursors
+                 (name TEXT PRIMARY KEY,
+                  last_id INTEGER DEFAULT 0)''')
+    
+    # Lançamentos de horas por tarefa, usuário e dia
+    c.execute('''CREATE TABLE IF NOT EXISTS time_entries
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  task_id INTEGER,
+                  user_id INTEGER,
+                  day DATE,
+                  hours REAL,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    
+    # Tarefas criadas antes do histórico existir recebem um evento inicial
+    if 'task_events' not in existing_tables:
+        c.execute("""INSERT INTO task_events (task_id, project_id, status, hours_worked, changed_by, created_at)
+                     SELECT id, project_id, status, hours_worked, assigned_to, created_at FROM tasks""")
+    
+    # Horas já registradas viram um lançamento único do responsável
+    if 'time_entries' not in existing_tables:
+        c.execute("""INSERT INTO time_entries (task_id, user_id, day, hours)
+                     SELECT id, assigned_to, date(created_at), hours_worked FROM tasks
+                     WHERE hours_worked > 0""")
+    
+    # Projetos visíveis a cada usuário (gerente ou membro), mantida pelos gatilhos abaixo
+    c.execute('''CREATE TABLE IF NOT EXISTS project_visibility
+                 (user_id INTEGER,
+                  project_id INTEGER,
+                  PRIMARY KEY (user_id, project_id)) WITHOUT ROWID''')
+    
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_project_members_insert AFTER INSERT ON project_members
+                 BEGIN
+                     INSERT OR IGNORE INTO project_visibility (user_id, project_id)
+                     VALUES (NEW.user_id, NEW.project_id);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_project_members_delete AFTER DELETE ON project_members
+                 BEGIN
+                     DELETE FROM project_visibility
+                     WHERE user_id = OLD.user_id AND project_id = OLD.project_id
+                       AND NOT EXISTS (SELECT 1 FROM projects WHERE id = OLD.project_id AND manager_id = OLD.user_id);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_projects_insert AFTER INSERT ON projects
+                 WHEN NEW.manager_id IS NOT NULL
+                 BEGIN
+                     INSERT OR IGNORE INTO project_visibility (user_id, project_id)
+                     VALUES (NEW.manager_id, NEW.id);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_projects_manager_update AFTER UPDATE OF manager_id ON projects
+                 BEGIN
+                     DELETE FROM project_visibility
+                     WHERE user_id = OLD.manager_id AND project_id = OLD.id
+                       AND NOT EXISTS (SELECT 1 FROM project_members WHERE project_id = OLD.id AND user_id = OLD.manager_id);
+                     INSERT OR IGNORE INTO project_visibility (user_id, project_id)
+                     SELECT NEW.manager_id, NEW.id WHERE NEW.manager_id IS NOT NULL;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_projects_delete AFTER DELETE ON projects
+                 BEGIN
+                     DELETE FROM project_visibility WHERE project_id = OLD.id;
+                 END''')
+    
+    if 'project_visibility' not in existing_tables:
+        rebuild_project_visibility(c)
+    
+    # Resultados das tarefas periódicas
+    c.execute('''CREATE TABLE IF NOT EXISTS project_summary
+                 (project_id INTEGER PRIMARY KEY,
+                  total_tasks INTEGER,
+                  completed_tasks INTEGER,
+                  total_hours REAL,
+                  updated_at TIMESTAMP)''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS system_summary
+                 (name TEXT PRIMARY KEY,
+                  value REAL,
+                  updated_at TIMESTAMP)''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS due_date_digests
+                 (user_id INTEGER,
+                  task_id INTEGER,
+                  project_name TEXT,
+                  description TEXT,
+                  end_date DATE,
+                  assigned_name TEXT,
+                  PRIMARY KEY (user_id, task_id)) WITHOUT ROWID''')
+    
+    # Controle e métricas das tarefas periódicas
+    c.execute('''CREATE TABLE IF NOT EXISTS scheduled_jobs
+                 (name TEXT PRIMARY KEY,
+                  running_since TIMESTAMP,
+                  last_started_at TIMESTAMP,
+                  last_finished_at TIMESTAMP,
+                  last_duration_seconds REAL,
+                  avg_duration_seconds REAL,
+                  max_duration_seconds REAL,
+                  runs INTEGER DEFAULT 0,
+                  failures INTEGER DEFAULT 0,
+                  skipped_overlaps INTEGER DEFAULT 0,
+                  last_error TEXT)''')
+    
+    # Catálogo de backups
+    c.execute('''CREATE TABLE IF NOT EXISTS backups
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  file TEXT UNIQUE,
+                  kind TEXT,
+                  created_at TIMESTAMP,
+                  size_bytes INTEGER,
+                  pages INTEGER,
+                  duration_seconds REAL,
+                  throughput_mb_s REAL,
+                  restarts INTEGER,
+                  max_writer_stall_ms REAL,
+                  avg_writer_stall_ms REAL)''')
+    
+    # Contadores de alteração por tabela: uma linha por tabela, incrementada a cada
+    # linha inserida, alterada ou removida (a API compara os contadores antes de consultar)
+    c.execute('''CREATE TABLE IF NOT EXISTS table_versions
+                 (table_name TEXT PRIMARY KEY,
+                  version INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID''')
+    # Só grava contadores ausentes: um INSERT OR IGNORE a cada execução pegaria o
+    # bloqueio de escrita e falharia enquanto outra conexão estivesse escrevendo
+    c.execute("SELECT table_name FROM table_versions")
+    seeded_tables = {row[0] for row in c.fetchall()}
+    for table in VERSIONED_TABLES:
+        if table not in seeded_tables:
+            c.execute("INSERT INTO table_versions (table_name) VALUES (?)", (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                         AFTER {event} ON {table}
+                         BEGIN
+                             UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}';
+                         END''')
+    # project_summary deixou de ser versionada (nenhuma rota da API a lê); remove os
+    # gatilhos de bancos antigos apenas se existirem, sem escrever a cada execução
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name GLOB 'trg_project_summary_*'")
+    for (trigger,) in c.fetchall():
+        c.execute(f"DROP TRIGGER {trigger}")
+    
+    # Índices
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_project_id ON messages (project_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_full_name ON users (full_name COLLATE NOCASE)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users (username COLLATE NOCASE)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_project_visibility_project_id ON project_visibility (project_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_task_events_task_id ON task_events (task_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_time_entries_user_day ON time_entries (user_id, day)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_time_entries_task_id ON time_entries (task_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_project_start ON tasks (project_id, start_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_assigned_to ON tasks (assigned_to)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_projects_status ON projects (status)")
+    
     conn.commit()
     conn.close()
 
+def rebuild_project_visibility(c):
+    """Refaz a visibilidade a partir das equipes e dos gerentes (após reescritas em massa dessas tabelas)"""
+    c.execute("DELETE FROM project_visibility")
+    c.execute("""INSERT OR IGNORE INTO project_visibility (user_id, project_id)
+                 SELECT user_id, project_id FROM project_members""")
+    c.execute("""INSERT OR IGNORE INTO project_visibility (user_id, project_id)
+                 SELECT manager_id, id FROM projects WHERE manager_id IS NOT NULL""")
+
 def hash_password(password):
     """Criptografa a senha"""
     return hashlib.sha256(password.encode()).hexdigest()
@@ -98,8 +372,7 @@ def authenticate_user(username, password):
     c = conn.cursor()
     hashed_password = hash_password(password)
     
-    c.execute("SELECT * FROM users WHERE username = ? AND password = ?", 
-              (username, hashed_password))
+    c.execute(QUERIES['autenticar_usuario'], (username, hashed_password))
     user = c.fetchone()
     conn.close()
     
@@ -129,207 +402,1608 @@ def register_user(username, password, email, role, full_name):
         return False
 
 # Funções de gerenciamento de dados
-def get_projects(user_id=None):
-    """Obtém projetos do banco de dados"""
-    conn = sqlite3.connect('scpe.db')
+
+@st.cache_resource
+def get_read_pool():
+    """Conexões somente leitura ociosas e vagas do pool, compartilhadas entre as sessões"""
+    return {'idle': queue.LifoQueue(), 'slots': threading.BoundedSemaphore(READ_POOL_SIZE)}
+
+@contextlib.contextmanager
+def read_snapshot(timeout=READ_STATEMENT_TIMEOUT):
+    """Conexão somente leitura (mode=ro) presa a um snapshot do WAL durante o bloco
+    
+    Todas as consultas do bloco veem o banco como estava na primeira leitura, sem
+    disputar com as escritas; consultas que passam de timeout segundos são interrompidas.
+    """
+    pool = get_read_pool()
+    if not pool['slots'].acquire(timeout=timeout):
+        raise sqlite3.OperationalError("Nenhuma conexão de leitura disponível")
+    
+    try:
+        conn = pool['idle'].get_nowait()
+    except queue.Empty:
+        conn = sqlite3.connect('file:scpe.db?mode=ro', uri=True, check_same_thread=False)
+    
+    # O prazo recomeça a cada consulta: o callback de trace é chamado no início de cada uma
+    deadline = [0.0]
+    
+    def start_statement(sql):
+        deadline[0] = time.monotonic() + timeout
+    
+    conn.set_trace_callback(start_statement)
+    conn.set_progress_handler(lambda: time.monotonic() > deadline[0], 10000)
+    try:
+        conn.execute("BEGIN")
+        yield conn
+    finally:
+        # Encerrar a leitura libera o snapshot; conexões que falham aqui são descartadas
+        try:
+            conn.rollback()
+            conn.set_progress_handler(None, 0)
+            conn.set_trace_callback(None)
+            pool['idle'].put(conn)
+        except sqlite3.Error:
+            conn.close()
+        pool['slots'].release()
+
+def connect(snapshot=None):
+    """Conexão para leitura: o snapshot recebido ou uma nova conexão com o banco"""
+    return snapshot if snapshot is not None else sqlite3.connect('scpe.db')
+
+# Colunas que podem ser pedidas às funções get_*, com a expressão SQL de cada uma
+PROJECT_COLUMNS = {
+    'id': 'p.id',
+    'name': 'p.name',
+    'description': 'p.description',
+    'client': 'p.client',
+    'budget': 'p.budget',
+    'total_deadline': 'p.total_deadline',
+    'manager_id': 'p.manager_id',
+    'status': 'p.status',
+    'created_at': 'p.created_at',
+    'manager_name': 'u.full_name'
+}
+
+TASK_COLUMNS = {
+    'id': 't.id',
+    'project_id': 't.project_id',
+    'description': 't.description',
+    'start_date': 't.start_date',
+    'end_date': 't.end_date',
+    'status': 't.status',
+    'assigned_to': 't.assigned_to',
+    'dependency_id': 't.dependency_id',
+    'hours_worked': 't.hours_worked',
+    'created_at': 't.created_at',
+    'assigned_name': 'u.full_name',
+    'project_name': 'p.name'
+}
+
+# Tipos compactos: ids inteiros de 32 bits (com nulo quando a referência é opcional),
+# textos repetidos como categorias e datas convertidas
+ID_COLUMNS = {'id': 'int32', 'project_id': 'int32', 'user_id': 'int32',
+              'manager_id': 'Int32', 'assigned_to': 'Int32', 'dependency_id': 'Int32'}
+CATEGORY_COLUMNS = {'status', 'role', 'user_role', 'project_role',
+                    'project_name', 'assigned_name', 'manager_name'}
+DATE_COLUMNS = {'start_date', 'end_date', 'total_deadline', 'created_at'}
+
+# Consultas dos caminhos mais usados, centralizadas para que planos.py confira o plano
+# de execução de cada uma (EXPLAIN QUERY PLAN). {select}, {joins} e {placeholders} são
+# preenchidos por quem usa a consulta.
+QUERIES = {
+    'autenticar_usuario': """SELECT * FROM users WHERE username = ? AND password = ?""",
+    'projetos_visiveis': """SELECT {select}
+                            FROM project_visibility v
+                            JOIN projects p ON p.id = v.project_id
+                            {joins}
+                            WHERE v.user_id = ? AND (? OR p.status != 'modelo')""",
+    'projetos_todos': """SELECT {select}
+                         FROM projects p
+                         {joins}
+                         WHERE ? OR p.status != 'modelo'""",
+    'membros_projeto': """SELECT u.id, u.full_name, u.role as user_role, pm.role as project_role
+                          FROM project_members pm
+                          JOIN users u ON pm.user_id = u.id
+                          WHERE pm.project_id = ?
+                          ORDER BY u.full_name""",
+    'membro_do_projeto': """SELECT * FROM project_members WHERE project_id = ? AND user_id = ?""",
+    'membros_equipe': """SELECT * FROM project_members WHERE project_id = ?""",
+    'nomes_usuarios': """SELECT id, full_name FROM users WHERE id IN ({placeholders})""",
+    'tarefas_projeto': """SELECT {select}
+                          FROM tasks t
+                          {joins}
+                          WHERE t.project_id = ?""",
+    # Tarefas de modelos de projeto não são trabalho real: ficam fora das listas e contagens
+    'tarefas_todas': """SELECT {select}
+                        FROM tasks t
+                        {joins}
+                        WHERE t.project_id NOT IN (SELECT id FROM projects WHERE status = 'modelo')""",
+    'tarefas_responsavel': """SELECT {select}
+                              FROM tasks t
+                              {joins}
+                              WHERE t.assigned_to = ?
+                                AND t.project_id NOT IN (SELECT id FROM projects WHERE status = 'modelo')""",
+    'atualizar_status_tarefa': """UPDATE tasks SET status = ? WHERE id = ?""",
+    'usuarios': """SELECT id, username, full_name, role FROM users""",
+    # Cada ramo percorre seu índice em ordem e para após "limit" usuários fora do projeto
+    'buscar_usuarios': """SELECT * FROM (
+                              SELECT id, username, full_name, role FROM users u
+                              WHERE full_name COLLATE NOCASE >= :low AND full_name COLLATE NOCASE < :high
+                                AND NOT EXISTS (SELECT 1 FROM project_members pm
+                                                WHERE pm.project_id = :project_id AND pm.user_id = u.id)
+                              ORDER BY full_name COLLATE NOCASE
+                              LIMIT :limit
+                          )
+                          UNION
+                          SELECT * FROM (
+                              SELECT id, username, full_name, role FROM users u
+                              WHERE username COLLATE NOCASE >= :low AND username COLLATE NOCASE < :high
+                                AND NOT EXISTS (SELECT 1 FROM project_members pm
+                                                WHERE pm.project_id = :project_id AND pm.user_id = u.id)
+                              ORDER BY username COLLATE NOCASE
+                              LIMIT :limit
+                          )
+                          ORDER BY full_name COLLATE NOCASE
+                          LIMIT :limit""",
+    'equipes_usuario': """SELECT p.id as project_id,
+                                 p.name as project_name,
+                                 mgr.full_name as manager_name,
+                                 u.id as user_id,
+                                 u.full_name,
+                                 u.role as user_role,
+                                 pm.role as project_role,
+                                 COALESCE(u.id = p.manager_id, 0) as is_manager
+                          FROM project_visibility v
+                          JOIN projects p ON p.id = v.project_id
+                          LEFT JOIN users mgr ON p.manager_id = mgr.id
+                          LEFT JOIN project_members pm ON pm.project_id = p.id
+                          LEFT JOIN users u ON pm.user_id = u.id
+                          WHERE v.user_id = ?
+                          ORDER BY p.id, u.full_name""",
+    # Apenas as últimas mensagens, devolvidas em ordem crescente
+    'ultimas_mensagens': """SELECT * FROM (
+                                SELECT m.id, m.message, m.created_at, u.full_name as from_user_name
+                                FROM messages m
+                                JOIN users u ON m.from_user = u.id
+                                WHERE m.project_id = ? AND m.id > ?
+                                ORDER BY m.id DESC
+                                LIMIT ?
+                            ) ORDER BY id""",
+    'mensagens_novas': """SELECT m.id, m.message, m.created_at, u.full_name as from_user_name
+                          FROM messages m
+                          JOIN users u ON m.from_user = u.id
+                          WHERE m.project_id = ? AND m.id > ?
+                          ORDER BY m.id""",
+    'mensagens_anteriores': """SELECT m.id, m.message, m.created_at, u.full_name as from_user_name
+                               FROM messages m
+                               JOIN users u ON m.from_user = u.id
+                               WHERE m.project_id = ? AND m.id < ?
+                               ORDER BY m.id DESC
+                               LIMIT ?""",
+    'blocos_arquivo_mensagens': """SELECT payload FROM message_archive
+                                   WHERE project_id = ? AND first_id < ?
+                                   ORDER BY month DESC""",
+    'arquivo_mensagens_existe': """SELECT EXISTS (SELECT 1 FROM message_archive WHERE project_id = ?)""",
+    'lancamentos_usuario': """SELECT te.id, te.day, te.hours, t.description as task_description,
+                                     p.name as project_name
+                              FROM time_entries te
+                              JOIN tasks t ON te.task_id = t.id
+                              LEFT JOIN projects p ON t.project_id = p.id
+                              WHERE te.user_id = ? AND te.day BETWEEN ? AND ?
+                              ORDER BY te.day DESC, te.id DESC""",
+    'horas_por_periodo': """SELECT period,
+                                   hours,
+                                   SUM(hours) OVER (ORDER BY period) as cumulative_hours,
+                                   AVG(hours) OVER (ORDER BY period ROWS BETWEEN 3 PRECEDING AND CURRENT ROW)
+                                       as moving_average
+                            FROM (
+                                SELECT strftime(?, day) as period, SUM(hours) as hours
+                                FROM time_entries
+                                WHERE user_id = ? AND day BETWEEN ? AND ?
+                                GROUP BY period
+                            )
+                            ORDER BY period""",
+    'fluxo_projeto': """SELECT day, status, net_change, entered
+                        FROM task_daily_buckets
+                        WHERE project_id = ?
+                        ORDER BY day""",
+    # Tarefas com o mesmo responsável e as mesmas datas (já recortadas na janela) viram uma linha
+    'cronograma_projeto': """SELECT COALESCE(u.full_name, 'Sem responsável') as lane,
+                                    MAX(t.start_date, :window_start) as start_date,
+                                    MIN(t.end_date, :window_end) as end_date,
+                                    COUNT(*) as tasks
+                             FROM tasks t
+                             LEFT JOIN users u ON t.assigned_to = u.id
+                             WHERE t.project_id = :project_id
+                               AND t.start_date <= :window_end
+                               AND t.end_date >= :window_start
+                             GROUP BY lane, 2, 3""",
+    'prazos_usuario': """SELECT task_id, project_name, description, end_date, assigned_name
+                         FROM due_date_digests
+                         WHERE user_id = ?
+                         ORDER BY end_date""",
+    # O "+" impede o uso de idx_tasks_assigned_to: para ler quase toda a tabela, a varredura
+    # sequencial é mais rápida que percorrer o índice
+    'capacidade_tarefas': """SELECT id, assigned_to, start_date, end_date, status, hours_worked
+                             FROM tasks
+                             WHERE status != 'concluída' AND +assigned_to IS NOT NULL
+                               AND project_id NOT IN (SELECT id FROM projects WHERE status = 'modelo')""",
+    'capacidade_tarefas_usuarios': """SELECT id, assigned_to, start_date, end_date, status, hours_worked
+                                      FROM tasks
+                                      WHERE status != 'concluída'
+                                        AND assigned_to IN (SELECT value FROM json_each(?))
+                                        AND project_id NOT IN (SELECT id FROM projects WHERE status = 'modelo')""",
+    'capacidade_assinaturas': """SELECT assigned_to,
+                                        COUNT(*) as tasks,
+                                        TOTAL(id) as ids,
+                                        TOTAL(id * julianday(start_date)) as starts,
+                                        TOTAL(id * julianday(end_date)) as ends,
+                                        TOTAL(id * hours_worked) as hours,
+                                        TOTAL(id * (status = 'em andamento')) as in_progress
+                                 FROM tasks
+                                 WHERE status != 'concluída' AND +assigned_to IS NOT NULL
+                                   AND project_id NOT IN (SELECT id FROM projects WHERE status = 'modelo')
+                                 GROUP BY +assigned_to""",
+    # API de leitura (api.py): páginas por chave, a partir da última linha da página anterior
+    'versoes_tabelas': """SELECT table_name, version FROM table_versions
+                          WHERE table_name IN (SELECT value FROM json_each(?))""",
+    'api_projetos': """SELECT p.id, p.name, p.description, p.client, p.budget, p.total_deadline, p.status,
+                              p.created_at, p.manager_id, u.full_name as manager_name
+                       FROM projects p
+                       LEFT JOIN users u ON p.manager_id = u.id
+                       WHERE p.id > ?
+                       ORDER BY p.id
+                       LIMIT ?""",
+    'api_tarefas': """SELECT t.id, t.project_id, t.description, t.start_date, t.end_date, t.status,
+                             t.assigned_to, u.full_name as assigned_name, t.dependency_id, t.hours_worked
+                      FROM tasks t
+                      LEFT JOIN users u ON t.assigned_to = u.id
+                      WHERE t.id > ?
+                      ORDER BY t.id
+                      LIMIT ?""",
+    'api_tarefas_projeto': """SELECT t.id, t.project_id, t.description, t.start_date, t.end_date, t.status,
+                                     t.assigned_to, u.full_name as assigned_name, t.dependency_id, t.hours_worked
+                              FROM tasks t
+                              LEFT JOIN users u ON t.assigned_to = u.id
+                              WHERE t.project_id = ? AND (t.start_date, t.id) > (?, ?)
+                              ORDER BY t.start_date, t.id
+                              LIMIT ?""",
+    'api_membros_projeto': """SELECT u.id, u.full_name, u.role as user_role, pm.role as project_role
+                              FROM project_members pm
+                              JOIN users u ON pm.user_id = u.id
+                              WHERE pm.project_id = ? AND pm.user_id > ?
+                              ORDER BY pm.user_id
+                              LIMIT ?""",
+    'api_metricas_projeto': """SELECT COUNT(*) as total_tasks,
+                                      TOTAL(status = 'concluída') as completed_tasks,
+                                      TOTAL(hours_worked) as total_hours
+                               FROM tasks
+                               WHERE project_id = ?"""
+}
+
+def select_columns(columns, available):
+    """Monta a lista de colunas do SELECT a partir dos nomes pedidos"""
+    columns = list(available) if columns is None else columns
+    unknown = set(columns) - set(available)
+    if unknown:
+        raise ValueError(f"Colunas desconhecidas: {', '.join(sorted(unknown))}")
+    return ', '.join(f"{available[column]} as {column}" for column in columns)
+
+def compact_frame(df):
+    """Converte as colunas do DataFrame para os tipos compactos"""
+    for column in df.columns:
+        if column in ID_COLUMNS:
+            df[column] = df[column].astype(ID_COLUMNS[column])
+        elif column in CATEGORY_COLUMNS:
+            df[column] = df[column].astype('category')
+        elif column in DATE_COLUMNS:
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+    return df
+
+def format_date(value, fmt='%Y-%m-%d'):
+    """Formata uma data convertida por compact_frame (vazia quando ausente)"""
+    return value.strftime(fmt) if pd.notna(value) else "-"
+
+def get_projects(user_id=None, columns=None, snapshot=None, include_templates=True):
+    """Obtém projetos do banco de dados (apenas as colunas pedidas)
+    
+    Com include_templates=False os modelos de projeto ficam de fora (páginas de trabalho real).
+    """
+    conn = connect(snapshot)
+    select = select_columns(columns, PROJECT_COLUMNS)
+    manager_join = "LEFT JOIN users u ON p.manager_id = u.id" if 'u.' in select else ""
     
     if user_id:
-        query = """SELECT p.*, u.full_name as manager_name 
-                   FROM projects p 
-                   LEFT JOIN users u ON p.manager_id = u.id
-                   WHERE p.manager_id = ? OR p.id IN (
-                       SELECT project_id FROM project_members WHERE user_id = ?
-                   )"""
-        df = pd.read_sql_query(query, conn, params=(user_id, user_id))
+        query = QUERIES['projetos_visiveis'].format(select=select, joins=manager_join)
+        df = pd.read_sql_query(query, conn, params=(int(user_id), include_templates))
     else:
-        query = """SELECT p.*, u.full_name as manager_name 
-                   FROM projects p 
-                   LEFT JOIN users u ON p.manager_id = u.id"""
-        df = pd.read_sql_query(query, conn)
+        query = QUERIES['projetos_todos'].format(select=select, joins=manager_join)
+        df = pd.read_sql_query(query, conn, params=(include_templates,))
     
-    conn.close()
-    return df
+    if snapshot is None:
+        conn.close()
+    return compact_frame(df)
 
-def get_project_members(project_id):
+def get_project_members(project_id, snapshot=None):
     """Obtém membros de um projeto - VERSÃO CORRIGIDA"""
-    conn = sqlite3.connect('scpe.db')
+    conn = connect(snapshot)
     
     try:
-        # Query corrigida - mais robusta e clara
-        query = """
-        SELECT 
-            u.id,
-            u.full_name, 
-            u.role as user_role,
-            pm.role as project_role
-        FROM project_members pm
-        JOIN users u ON pm.user_id = u.id
-        WHERE pm.project_id = ?
-        ORDER BY u.full_name
-        """
-        
-        df = pd.read_sql_query(query, conn, params=(project_id,))
-        return df
+        df = pd.read_sql_query(QUERIES['membros_projeto'], conn, params=(int(project_id),))
+        return compact_frame(df)
         
     except Exception as e:
         st.error(f"Erro ao buscar membros do projeto: {e}")
         return pd.DataFrame()
     finally:
-        conn.close()
+        if snapshot is None:
+            conn.close()
 
 def is_user_in_project(project_id, user_id):
     """Verifica se um usuário já está no projeto"""
     conn = sqlite3.connect('scpe.db')
     c = conn.cursor()
-    c.execute("SELECT 1 FROM project_members WHERE project_id = ? AND user_id = ?", 
-              (project_id, user_id))
+    c.execute(QUERIES['membro_do_projeto'], (project_id, user_id))
     result = c.fetchone() is not None
     conn.close()
     return result
 
-def get_tasks(project_id=None):
-    """Obtém tarefas do banco de dados"""
-    conn = sqlite3.connect('scpe.db')
+def get_tasks(project_id=None, columns=None, snapshot=None, assigned_to=None):
+    """Obtém tarefas do banco de dados (apenas as colunas pedidas), de um projeto ou de um responsável"""
+    conn = connect(snapshot)
+    select = select_columns(columns, TASK_COLUMNS)
+    
+    # Os JOINs só entram quando os nomes do responsável ou do projeto são pedidos
+    joins = ""
+    if 'u.' in select:
+        joins += "LEFT JOIN users u ON t.assigned_to = u.id\n"
+    if 'p.' in select:
+        joins += "LEFT JOIN projects p ON t.project_id = p.id\n"
     
     if project_id:
-        query = """SELECT t.*, u.full_name as assigned_name, p.name as project_name
-                   FROM tasks t
-                   LEFT JOIN users u ON t.assigned_to = u.id
-                   LEFT JOIN projects p ON t.project_id = p.id
-                   WHERE t.project_id = ?"""
-        df = pd.read_sql_query(query, conn, params=(project_id,))
+        query = QUERIES['tarefas_projeto'].format(select=select, joins=joins)
+        df = pd.read_sql_query(query, conn, params=(int(project_id),))
+    elif assigned_to:
+        query = QUERIES['tarefas_responsavel'].format(select=select, joins=joins)
+        df = pd.read_sql_query(query, conn, params=(int(assigned_to),))
     else:
-        query = """SELECT t.*, u.full_name as assigned_name, p.name as project_name
-                   FROM tasks t
-                   LEFT JOIN users u ON t.assigned_to = u.id
-                   LEFT JOIN projects p ON t.project_id = p.id"""
+        query = QUERIES['tarefas_todas'].format(select=select, joins=joins)
         df = pd.read_sql_query(query, conn)
     
-    conn.close()
-    return df
+    if snapshot is None:
+        conn.close()
+    return compact_frame(df)
 
-def get_users():
+def get_users(snapshot=None):
     """Obtém todos os usuários"""
+    conn = connect(snapshot)
+    df = pd.read_sql_query(QUERIES['usuarios'], conn)
+    if snapshot is None:
+        conn.close()
+    return compact_frame(df)
+
+def search_users(term, exclude_project_id=None, limit=USER_SEARCH_LIMIT):
+    """Busca usuários pelo início do nome ou do login (usa os índices COLLATE NOCASE)"""
+    term = term.strip()
+    if not term:
+        return pd.DataFrame(columns=['id', 'username', 'full_name', 'role'])
+    
+    exclude_project_id = int(exclude_project_id) if exclude_project_id is not None else -1
     conn = sqlite3.connect('scpe.db')
-    df = pd.read_sql_query("SELECT id, username, full_name, role FROM users", conn)
+    query = QUERIES['buscar_usuarios']
+    params = {'project_id': exclude_project_id, 'limit': int(limit)}
+    df = pd.read_sql_query(query, conn, params={**params, 'low': term, 'high': term + '\U0010ffff'})
+    
+    # Tolerância a erros de digitação: candidatos com as mesmas duas primeiras letras,
+    # ordenados pela semelhança com o termo buscado
+    if len(df) < limit and len(term) >= 3:
+        candidates = pd.read_sql_query(query, conn, params={**params, 'low': term[:2],
+                                                            'high': term[:2] + '\U0010ffff',
+                                                            'limit': 500})
+        candidates = candidates[~candidates['id'].isin(df['id'])]
+        
+        # Compara também com prefixos um pouco maiores que o termo: uma letra esquecida
+        # na digitação não deve cortar o fim do nome
+        def similarity(row):
+            return max(difflib.SequenceMatcher(None, term.lower(), value[:len(term) + extra].lower()).ratio()
+                       for value in (row['full_name'], row['username']) for extra in range(3))
+        
+        if not candidates.empty:
+            candidates['score'] = candidates.apply(similarity, axis=1)
+            candidates = candidates[candidates['score'] >= 0.7].sort_values('score', ascending=False)
+            df = pd.concat([df, candidates.drop(columns='score')]).head(limit)
+    
     conn.close()
-    return df
+    return df.reset_index(drop=True)
 
-def get_user_projects(user_id):
-    """Obtém projetos de um usuário específico"""
+def get_team_rosters(user_id):
+    """Obtém as equipes de todos os projetos do usuário, agrupadas por id do projeto"""
     conn = sqlite3.connect('scpe.db')
-    query = """SELECT p.*, u.full_name as manager_name 
-               FROM projects p 
-               LEFT JOIN users u ON p.manager_id = u.id
-               WHERE p.id IN (
-                   SELECT project_id FROM project_members WHERE user_id = ?
-               ) OR p.manager_id = ?"""
-    df = pd.read_sql_query(query, conn, params=(user_id, user_id))
+    df = pd.read_sql_query(QUERIES['equipes_usuario'], conn, params=(int(user_id),))
     conn.close()
-    return df
-# show
+    
+    rosters = {}
+    for project_id, rows in df.groupby('project_id', sort=False):
+        members = rows[rows['user_id'].notna()].drop(columns=['project_id', 'project_name', 'manager_name'])
+        members = members.astype({'user_id': int, 'is_manager': bool})
+        rosters[project_id] = {
+            'name': rows['project_name'].iloc[0],
+            'manager_name': rows['manager_name'].iloc[0],
+            'members': members.reset_index(drop=True)
+        }
+    return rosters
 
-def debug_database_state():
-    """Debug completo do estado do banco de dados"""
+def get_new_messages(project_id, last_id=0, limit=None):
+    """Obtém mensagens de um projeto com id maior que last_id (usa o índice project_id, id)"""
     conn = sqlite3.connect('scpe.db')
+    if limit:
+        df = pd.read_sql_query(QUERIES['ultimas_mensagens'], conn,
+                               params=(int(project_id), int(last_id), int(limit)))
+    else:
+        df = pd.read_sql_query(QUERIES['mensagens_novas'], conn, params=(int(project_id), int(last_id)))
+    conn.close()
+    return df
+
+def log_task_event(c, task_id, project_id, status, hours_worked, changed_by):
+    """Registra um evento de tarefa usando o cursor (e a transação) de quem alterou a tarefa"""
+    c.execute("""INSERT INTO task_events (task_id, project_id, status, hours_worked, changed_by)
+                 VALUES (?, ?, ?, ?, ?)""",
+              (int(task_id), int(project_id), status, float(hours_worked), int(changed_by)))
+
+def log_current_task_events(c, task_ids, changed_by):
+    """Registra eventos com o status e as horas gravados nas tarefas, na transação de quem as alterou"""
+    c.executemany("""INSERT INTO task_events (task_id, project_id, status, hours_worked, changed_by)
+                     SELECT id, project_id, status, hours_worked, ? FROM tasks WHERE id = ?""",
+                  [(int(changed_by), int(task_id)) for task_id in task_ids])
+
+def add_time_entry(c, task_id, user_id, day, hours):
+    """Lança horas em uma tarefa e atualiza o total acumulado da tarefa na mesma transação"""
+    c.execute("INSERT INTO time_entries (task_id, user_id, day, hours) VALUES (?, ?, ?, ?)",
+              (int(task_id), int(user_id), day, float(hours)))
+    c.execute("UPDATE tasks SET hours_worked = hours_worked + ? WHERE id = ?", (float(hours), int(task_id)))
+
+def bulk_update_tasks(tasks, action, value, changed_by):
+    """Aplica uma ação a várias tarefas com executemany em uma única transação
     
-    st.write("### 🔍 DIAGNÓSTICO DO BANCO DE DADOS")
-    
-    # 1. Verificar todas as tabelas
-    st.write("**1. Todas as tabelas no banco:**")
-    tables = pd.read_sql_query("SELECT name FROM sqlite_master WHERE type='table'", conn)
-    st.write(tables)
+    tasks é o DataFrame das tarefas selecionadas (coluna id); action é 'status', 'reassign'
+    (value é o id do usuário), 'hours' ou 'deadline' (value em dias). Os eventos são gravados
+    a partir das tarefas já alteradas, não dos valores exibidos na página.
+    """
+    task_ids = [int(task_id) for task_id in tasks['id']]
+    changed_by = int(changed_by)
     
-    # 2. Verificar estrutura de project_members
-    st.write("**2. Estrutura de project_members:**")
+    conn = sqlite3.connect('scpe.db', timeout=30)
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
     try:
-        structure = pd.read_sql_query("PRAGMA table_info(project_members)", conn)
-        st.write(structure)
-    except:
-        st.error("❌ Tabela project_members não existe!")
+        if action == 'status':
+            c.executemany("UPDATE tasks SET status = ? WHERE id = ?",
+                          [(value, task_id) for task_id in task_ids])
+            log_current_task_events(c, task_ids, changed_by)
+        elif action == 'reassign':
+            c.executemany("UPDATE tasks SET assigned_to = ? WHERE id = ?",
+                          [(int(value), task_id) for task_id in task_ids])
+        elif action == 'hours':
+            today = str(datetime.date.today())
+            c.executemany("INSERT INTO time_entries (task_id, user_id, day, hours) VALUES (?, ?, ?, ?)",
+                          [(task_id, changed_by, today, float(value)) for task_id in task_ids])
+            c.executemany("UPDATE tasks SET hours_worked = hours_worked + ? WHERE id = ?",
+                          [(float(value), task_id) for task_id in task_ids])
+            log_current_task_events(c, task_ids, changed_by)
+        elif action == 'deadline':
+            # O término nunca fica antes do início
+            c.executemany("UPDATE tasks SET end_date = MAX(start_date, date(end_date, ?)) WHERE id = ?",
+                          [(f"{int(value):+d} days", task_id) for task_id in task_ids])
+        else:
+            raise ValueError(f"Ação em lote desconhecida: {action}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
     
-    # 3. Verificar todos os dados em project_members
-    st.write("**3. Todos os dados em project_members:**")
+    return len(task_ids)
+
+def clone_project(source_id, name, start_date, manager_id, status='ativo', copy_members=True):
+    """Copia um projeto (equipe e tarefas) inteiramente no banco, com INSERT ... SELECT em uma transação
+    
+    As datas são deslocadas para que a primeira tarefa comece em start_date, as dependências
+    entre tarefas passam a apontar para as cópias e o progresso (status e horas) é zerado.
+    Com status='modelo' a cópia vira um modelo de projeto, que fica fora das listas de
+    tarefas, do cronograma, da capacidade e dos alertas de prazo.
+    """
+    source_id = int(source_id)
+    conn = sqlite3.connect('scpe.db', timeout=30)
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
     try:
-        all_data = pd.read_sql_query("SELECT * FROM project_members", conn)
-        st.write(all_data)
-    except Exception as e:
-        st.error(f"❌ Erro ao acessar project_members: {e}")
-    
-    # 4. Verificar usuários
-    st.write("**4. Usuários no sistema:**")
-    users = pd.read_sql_query("SELECT id, full_name FROM users", conn)
-    st.write(users)
-    
-    # 5. Verificar projetos
-    st.write("**5. Projetos no sistema:**")
-    projects = pd.read_sql_query("SELECT id, name FROM projects", conn)
-    st.write(projects)
+        # Deslocamento em dias a partir do início da primeira tarefa (ou da criação do projeto)
+        c.execute("""SELECT CAST(julianday(?) - julianday(COALESCE(
+                                    (SELECT MIN(start_date) FROM tasks WHERE project_id = p.id),
+                                    date(p.created_at))) AS INTEGER)
+                     FROM projects p WHERE p.id = ?""", (str(start_date), source_id))
+        row = c.fetchone()
+        if row is None:
+            raise ValueError(f"Projeto {source_id} não encontrado")
+        shift = f"{row[0]:+d} days"
+        
+        c.execute("""INSERT INTO projects (name, description, client, budget, total_deadline, manager_id, status)
+                     SELECT ?, description, client, budget, date(total_deadline, ?), ?, ?
+                     FROM projects WHERE id = ?""",
+                  (name, shift, int(manager_id), status, source_id))
+        project_id = c.lastrowid
+        
+        if copy_members:
+            c.execute("""INSERT INTO project_members (project_id, user_id, role)
+                         SELECT ?, user_id, role FROM project_members WHERE project_id = ?""",
+                      (project_id, source_id))
+        
+        # As cópias recebem ids explícitos e consecutivos logo acima do maior id atual, na
+        # ordem das originais; a tabela temporária (indexada pelo id original) remapeia
+        # também a dependência de cada tarefa
+        c.execute("CREATE TEMP TABLE clone_ids (id INTEGER PRIMARY KEY, new_id INTEGER)")
+        c.execute("""INSERT INTO clone_ids (id, new_id)
+                     SELECT id, (SELECT MAX(id) FROM tasks) + ROW_NUMBER() OVER (ORDER BY id)
+                     FROM tasks WHERE project_id = ?""", (source_id,))
+        if c.rowcount:
+            c.execute("""INSERT INTO tasks (id, project_id, description, start_date, end_date, status,
+                                            assigned_to, dependency_id, hours_worked)
+                         SELECT n.new_id, ?, t.description,
+                                date(t.start_date, ?), date(t.end_date, ?), 'pendente',
+                                t.assigned_to, COALESCE(d.new_id, t.dependency_id), 0
+                         FROM clone_ids n
+                         JOIN tasks t ON t.id = n.id
+                         LEFT JOIN clone_ids d ON d.id = t.dependency_id""",
+                      (project_id, shift, shift))
+            c.execute("""INSERT INTO task_events (task_id, project_id, status, hours_worked, changed_by)
+                         SELECT id, project_id, status, 0, ? FROM tasks WHERE project_id = ?""",
+                      (int(manager_id), project_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
     
+    return project_id
+
+def get_time_entries(user_id, start_date, end_date):
+    """Obtém os lançamentos de horas de um usuário em um período (usa o índice user_id, day)"""
+    conn = sqlite3.connect('scpe.db')
+    df = pd.read_sql_query(QUERIES['lancamentos_usuario'], conn,
+                           params=(int(user_id), str(start_date), str(end_date)))
     conn.close()
+    return df
 
-def emergency_recreate_project_members():
-    """RECRIA COMPLETAMENTE a tabela project_members"""
-    st.write("### 🚨 RECRIAÇÃO DE EMERGÊNCIA - project_members")
-    
+def get_timesheet_rollup(user_id, start_date, end_date, period='week'):
+    """Obtém os totais semanais ou mensais de horas de um usuário, com acumulado e média móvel"""
+    period_format = '%Y-%W' if period == 'week' else '%Y-%m'
     conn = sqlite3.connect('scpe.db')
+    df = pd.read_sql_query(QUERIES['horas_por_periodo'], conn, params=(period_format, int(user_id), str(start_date), str(end_date)))
+    conn.close()
+    return df
+
+def refresh_task_buckets(wait=True):
+    """Atualiza os baldes diários processando apenas os eventos posteriores ao último já processado
+    
+    Sem eventos novos a trava de escrita nem é pedida. Com wait=False, se outra conexão estiver
+    escrevendo, desiste e devolve False: os baldes já gravados continuam valendo.
+    """
+    conn = sqlite3.connect('scpe.db', timeout=30 if wait else 0)
     c = conn.cursor()
     
     try:
-        # 1. Criar tabela temporária para backup
-        c.execute("DROP TABLE IF EXISTS project_members_backup")
-        c.execute("CREATE TABLE project_members_backup AS SELECT * FROM project_members")
+        c.execute("""SELECT (SELECT MAX(id) FROM task_events) >
+                            COALESCE((SELECT last_id FROM report_cursors WHERE name = 'task_events'), 0)""")
+        if not c.fetchone()[0]:
+            return True
         
-        # 2. Dropar e recriar a tabela principal
-        c.execute("DROP TABLE IF EXISTS project_members")
-        c.execute('''CREATE TABLE project_members
-                     (project_id INTEGER,
-                      user_id INTEGER,
-                      role TEXT,
-                      assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                      PRIMARY KEY (project_id, user_id))''')
+        # Trava de escrita: duas sessões não processam os mesmos eventos
+        try:
+            c.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError:
+            if wait:
+                raise
+            return False
+        c.execute("SELECT last_id FROM report_cursors WHERE name = 'task_events'")
+        row = c.fetchone()
+        last_id = row[0] if row else 0
+        
+        c.execute("""SELECT id, task_id, project_id, status, date(created_at)
+                     FROM task_events WHERE id > ? ORDER BY id""", (last_id,))
+        events = c.fetchall()
+        if not events:
+            return True
         
-        # 3. Restaurar dados do backup
-        c.execute("INSERT INTO project_members SELECT * FROM project_members_backup")
+        # Status anterior de cada tarefa envolvida
+        task_ids = list({event[1] for event in events})
+        previous = {}
+        for i in range(0, len(task_ids), 500):
+            chunk = task_ids[i:i + 500]
+            c.execute(f"SELECT task_id, status FROM task_status_snapshot WHERE task_id IN ({','.join(['?']*len(chunk))})",
+                      chunk)
+            previous.update(c.fetchall())
         
-        # 4. Limpar tabela temporária
-        c.execute("DROP TABLE IF EXISTS project_members_backup")
+        # Agrega as transições por (projeto, dia, status)
+        buckets = {}
+        snapshot = {}
+        for event_id, task_id, project_id, status, day in events:
+            old_status = previous.get(task_id)
+            if old_status == status:
+                continue
+            if old_status is not None:
+                key = (project_id, day, old_status)
+                net_change, entered = buckets.get(key, (0, 0))
+                buckets[key] = (net_change - 1, entered)
+            key = (project_id, day, status)
+            net_change, entered = buckets.get(key, (0, 0))
+            buckets[key] = (net_change + 1, entered + 1)
+            previous[task_id] = status
+            snapshot[task_id] = (task_id, project_id, status)
         
+        c.executemany("""INSERT INTO task_daily_buckets (project_id, day, status, net_change, entered)
+                         VALUES (?, ?, ?, ?, ?)
+                         ON CONFLICT (project_id, day, status) DO UPDATE SET
+                             net_change = net_change + excluded.net_change,
+                             entered = entered + excluded.entered""",
+                      [key + value for key, value in buckets.items()])
+        c.executemany("INSERT OR REPLACE INTO task_status_snapshot (task_id, project_id, status) VALUES (?, ?, ?)",
+                      list(snapshot.values()))
+        c.execute("INSERT OR REPLACE INTO report_cursors (name, last_id) VALUES ('task_events', ?)",
+                  (events[-1][0],))
         conn.commit()
+        return True
+    finally:
+        conn.close()
+
+def get_project_flow(project_id, snapshot=None):
+    """Obtém as séries diárias de fluxo cumulativo, burndown e tarefas concluídas de um projeto"""
+    # Com um snapshot, a atualização precisa vir antes da primeira leitura dele para ser vista.
+    # O agendador também atualiza os baldes: se o banco estiver ocupado com uma escrita, o
+    # relatório usa os baldes já gravados em vez de esperar pela trava
+    refresh_task_buckets(wait=False)
+    
+    conn = connect(snapshot)
+    buckets = pd.read_sql_query(QUERIES['fluxo_projeto'], conn, params=(int(project_id),))
+    if snapshot is None:
+        conn.close()
+    
+    if buckets.empty:
+        return pd.DataFrame(), pd.Series(dtype=float), pd.Series(dtype=float)
+    
+    buckets['day'] = pd.to_datetime(buckets['day'])
+    days = pd.date_range(buckets['day'].min(), max(buckets['day'].max(), pd.Timestamp(datetime.date.today())))
+    
+    # Fluxo cumulativo: quantidade de tarefas em cada status ao fim de cada dia
+    cumulative_flow = (buckets.pivot_table(index='day', columns='status', values='net_change', aggfunc='sum')
+                       .reindex(days, fill_value=0)
+                       .fillna(0)
+                       .cumsum())
+    cumulative_flow = cumulative_flow.reindex(columns=["pendente", "em andamento", "concluída"], fill_value=0)
+    
+    # Burndown: tarefas ainda não concluídas
+    burndown = cumulative_flow[["pendente", "em andamento"]].sum(axis=1)
+    
+    # Velocidade: tarefas concluídas por semana
+    completed = buckets[buckets['status'] == 'concluída'].set_index('day')['entered']
+    velocity = completed.reindex(days, fill_value=0).resample('W').sum()
+    
+    return cumulative_flow, burndown, velocity
+
+def timeline_bucket_keys(dates, zoom):
+    """Converte datas em números de período (dia, semana iniciando na segunda-feira ou mês)"""
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    if zoom == "Dia":
+        return dates.astype(np.int64)
+    if zoom == "Semana":
+        # O dia 0 (01/01/1970) é uma quinta-feira; +3 alinha as semanas na segunda-feira
+        return (dates.astype(np.int64) + 3) // 7
+    return dates.astype('datetime64[M]').astype(np.int64)
+
+def timeline_bucket_starts(keys, zoom):
+    """Obtém a data de início de cada período"""
+    keys = np.asarray(keys, dtype=np.int64)
+    if zoom == "Dia":
+        return keys.astype('datetime64[D]')
+    if zoom == "Semana":
+        return (keys * 7 - 3).astype('datetime64[D]')
+    return keys.astype('datetime64[M]').astype('datetime64[D]')
+
+def count_timeline_buckets(window_start, window_end, zoom):
+    """Quantidade de períodos de uma janela no zoom informado"""
+    keys = timeline_bucket_keys([window_start, window_end], zoom)
+    return int(keys[1] - keys[0] + 1)
+
+def get_timeline(project_id, window_start, window_end, zoom):
+    """Obtém as tarefas ativas por responsável e período, apenas dentro da janela visível"""
+    conn = sqlite3.connect('scpe.db')
+    df = pd.read_sql_query(QUERIES['cronograma_projeto'], conn, params={'project_id': int(project_id),
+                                                'window_start': str(window_start),
+                                                'window_end': str(window_end)})
+    conn.close()
+    
+    if df.empty:
+        return pd.DataFrame(columns=['lane', 'period', 'active_tasks'])
+    
+    first_key = timeline_bucket_keys([window_start], zoom)[0]
+    n_buckets = count_timeline_buckets(window_start, window_end, zoom)
+    start = timeline_bucket_keys(pd.to_datetime(df['start_date']).values, zoom) - first_key
+    end = timeline_bucket_keys(pd.to_datetime(df['end_date']).values, zoom) - first_key
+    lanes, lane_index = np.unique(df['lane'].to_numpy(dtype=str), return_inverse=True)
+    
+    # Vetor de diferenças por faixa: +n no primeiro período da tarefa, -n após o último
+    grid = np.zeros((len(lanes), n_buckets + 1), dtype=np.int64)
+    tasks = df['tasks'].to_numpy(dtype=np.int64)
+    np.add.at(grid, (lane_index, start), tasks)
+    np.add.at(grid, (lane_index, end + 1), -tasks)
+    grid = grid.cumsum(axis=1)[:, :-1]
+    
+    # Faixas com menos tarefas são agrupadas em "Outros"
+    if len(lanes) > TIMELINE_MAX_LANES:
+        order = np.argsort(-grid.sum(axis=1), kind='stable')
+        kept, others = order[:TIMELINE_MAX_LANES - 1], order[TIMELINE_MAX_LANES - 1:]
+        grid = np.vstack([grid[kept], grid[others].sum(axis=0)])
+        lanes = np.append(lanes[kept], "Outros")
+    
+    lane_rows, bucket_cols = np.nonzero(grid)
+    periods = timeline_bucket_starts(first_key + bucket_cols, zoom)
+    return pd.DataFrame({
+        'lane': lanes[lane_rows],
+        'period': pd.to_datetime(periods),
+        'active_tasks': grid[lane_rows, bucket_cols]
+    })
+
+def get_capacity_tasks(user_ids=None, snapshot=None):
+    """Obtém as tarefas abertas com responsável (as que ocupam capacidade), opcionalmente de alguns usuários"""
+    conn = connect(snapshot)
+    if user_ids is None:
+        df = pd.read_sql_query(QUERIES['capacidade_tarefas'], conn)
+    else:
+        df = pd.read_sql_query(QUERIES['capacidade_tarefas_usuarios'], conn,
+                               params=(json.dumps([int(user_id) for user_id in user_ids]),))
+    if snapshot is None:
+        conn.close()
+    return df
+
+def get_capacity_fingerprints(snapshot=None):
+    """Assinatura das tarefas abertas de cada usuário: somas ponderadas pelo id que mudam
+    quando qualquer tarefa dele muda, sem trazer as tarefas para o Python"""
+    conn = connect(snapshot)
+    df = pd.read_sql_query(QUERIES['capacidade_assinaturas'], conn, index_col='assigned_to')
+    if snapshot is None:
+        conn.close()
+    return df
+
+def compute_capacity_load(tasks, user_ids, start, days):
+    """Distribui o esforço restante das tarefas pelos dias úteis: matriz (usuário × dia) de horas"""
+    rows = pd.Index(user_ids).get_indexer(tasks['assigned_to'])
+    begin = pd.to_datetime(tasks['start_date'], errors='coerce').values.astype('datetime64[D]')
+    end = pd.to_datetime(tasks['end_date'], errors='coerce').values.astype('datetime64[D]')
+    valid = (rows >= 0) & ~np.isnat(begin) & ~np.isnat(end)
+    rows, begin, end = rows[valid], begin[valid], end[valid]
+    hours_worked = tasks['hours_worked'].fillna(0).to_numpy(dtype=np.float64)[valid]
+    
+    # Esforço previsto pelo prazo original, descontadas as horas já lançadas
+    begin = np.busday_offset(begin, 0, roll='forward')
+    end = np.maximum(np.busday_offset(end, 0, roll='backward'), begin)
+    remaining = np.maximum(np.busday_count(begin, end + 1) * TASK_HOURS_PER_DAY - hours_worked, 0)
+    
+    # O restante vai de hoje até o término; tarefas atrasadas caem inteiras no primeiro dia útil
+    begin = np.maximum(begin, np.busday_offset(start, 0, roll='forward'))
+    end = np.maximum(end, begin)
+    rate = remaining / np.busday_count(begin, end + 1)
+    
+    # Vetor de diferenças por usuário: +taxa no primeiro dia, -taxa após o último
+    first = (begin - start).astype(np.int64)
+    last = np.minimum((end - start).astype(np.int64) + 1, days)
+    inside = first < days
+    grid = np.zeros((len(user_ids), days + 1), dtype=np.float64)
+    np.add.at(grid, (rows[inside], first[inside]), rate[inside])
+    np.add.at(grid, (rows[inside], last[inside]), -rate[inside])
+    
+    workdays = np.is_busday(start + np.arange(days))
+    return np.maximum(grid.cumsum(axis=1)[:, :days] * workdays, 0).astype(np.float32)
+
+@st.cache_resource
+def get_capacity_state():
+    """Matriz de carga compartilhada entre as sessões, atualizada por linha de usuário"""
+    return {'lock': threading.Lock(), 'start': None, 'user_ids': None, 'load': None, 'fingerprints': None}
+
+def refresh_capacity():
+    """Atualiza a matriz de carga e devolve (início, ids dos usuários, carga, linhas recalculadas)
+    
+    A matriz é reconstruída quando muda o dia ou o conjunto de usuários; fora isso, só as
+    linhas dos usuários cujas tarefas abertas mudaram são recalculadas.
+    """
+    state = get_capacity_state()
+    today = np.datetime64(datetime.date.today(), 'D')
+    
+    # Assinaturas e tarefas lidas do mesmo snapshot, para que a matriz corresponda às assinaturas
+    with read_snapshot() as snapshot, state['lock']:
+        user_ids = get_users(snapshot)['id'].to_numpy(dtype=np.int64)
+        fingerprints = get_capacity_fingerprints(snapshot)
         
-        # 5. Verificar resultado
-        c.execute("SELECT COUNT(*) FROM project_members")
-        new_count = c.fetchone()[0]
+        if state['start'] != today or not np.array_equal(state['user_ids'], user_ids):
+            load = compute_capacity_load(get_capacity_tasks(snapshot=snapshot), user_ids, today,
+                                         CAPACITY_HORIZON_DAYS)
+            state.update(start=today, user_ids=user_ids, load=load, fingerprints=fingerprints)
+            recomputed = len(user_ids)
+        else:
+            known = state['fingerprints'].index.union(fingerprints.index)
+            old = state['fingerprints'].reindex(known, fill_value=0)
+            changed = known[old.ne(fingerprints.reindex(known, fill_value=0)).any(axis=1)]
+            changed = changed[np.isin(changed, user_ids)].to_numpy(dtype=np.int64)
+            
+            if len(changed):
+                rows = pd.Index(user_ids).get_indexer(changed)
+                state['load'][rows] = compute_capacity_load(get_capacity_tasks(changed, snapshot), changed, today,
+                                                            CAPACITY_HORIZON_DAYS)
+            state['fingerprints'] = fingerprints
+            recomputed = len(changed)
         
-        st.success(f"✅ **RECRIAÇÃO BEM-SUCEDIDA!**")
-        st.success(f"✅ Tabela project_members recriada com {new_count} registros")
+        return state['start'], state['user_ids'], state['load'].copy(), recomputed
+
+def get_chat_buffer(project_id):
+    """Obtém o buffer de mensagens do projeto na sessão, acrescentando apenas as novas"""
+    if 'chat_buffers' not in st.session_state:
+        st.session_state.chat_buffers = {}
+    
+    project_id = int(project_id)
+    buffer = st.session_state.chat_buffers.get(project_id)
+    
+    if buffer is None:
+        messages = get_new_messages(project_id, limit=CHAT_INITIAL_LIMIT).to_dict('records')
+        buffer = {
+            'messages': messages,
+            'last_id': messages[-1]['id'] if messages else 0,
+            'rendered_count': 0,
+            # Há anteriores se a primeira página veio cheia ou se o projeto tem mensagens arquivadas
+            'has_older': len(messages) == CHAT_INITIAL_LIMIT or has_archived_messages(project_id)
+        }
+        st.session_state.chat_buffers[project_id] = buffer
+    else:
+        new_messages = get_new_messages(project_id, buffer['last_id']).to_dict('records')
+        if new_messages:
+            buffer['messages'].extend(new_messages)
+            buffer['last_id'] = new_messages[-1]['id']
+    
+    return buffer
+
+def has_archived_messages(project_id):
+    """Verifica se o projeto tem mensagens no arquivo compactado"""
+    conn = sqlite3.connect('scpe.db')
+    c = conn.cursor()
+    c.execute(QUERIES['arquivo_mensagens_existe'], (int(project_id),))
+    result = bool(c.fetchone()[0])
+    conn.close()
+    return result
+
+def load_older_messages(project_id):
+    """Acrescenta ao início do buffer o bloco de mensagens anterior à mais antiga já carregada"""
+    buffer = get_chat_buffer(project_id)
+    before_id = buffer['messages'][0]['id'] if buffer['messages'] else 2 ** 63 - 1
+    older = get_older_messages(project_id, before_id).to_dict('records')
+    
+    buffer['messages'][:0] = older
+    buffer['has_older'] = len(older) == MESSAGE_PAGE_SIZE
+
+def get_older_messages(project_id, before_id, limit=MESSAGE_PAGE_SIZE):
+    """Obtém mensagens com id menor que before_id, lendo do arquivo quando as recentes acabam"""
+    conn = sqlite3.connect('scpe.db')
+    df = pd.read_sql_query(QUERIES['mensagens_anteriores'], conn,
+                           params=(int(project_id), int(before_id), int(limit)))
+    
+    # Leitura do arquivo, do mês mais recente para o mais antigo
+    if len(df) < limit:
+        archived = []
+        c = conn.cursor()
+        c.execute(QUERIES['blocos_arquivo_mensagens'], (int(project_id), int(before_id)))
+        for (payload,) in c:
+            messages = [m for m in json.loads(zlib.decompress(payload)) if m[0] < before_id]
+            archived.extend(reversed(messages))
+            if len(df) + len(archived) >= limit:
+                break
         
-        return True
+        if archived:
+            archived = pd.DataFrame(archived[:limit - len(df)], columns=['id', 'from_user', 'message', 'created_at'])
+            user_ids = archived['from_user'].unique().tolist()
+            query = QUERIES['nomes_usuarios'].format(placeholders=','.join(['?'] * len(user_ids)))
+            users = pd.read_sql_query(query, conn, params=user_ids)
+            users = users.rename(columns={'id': 'from_user', 'full_name': 'from_user_name'})
+            archived = archived.merge(users, on='from_user').drop(columns='from_user')
+            df = pd.concat([df, archived[df.columns]])
+    
+    conn.close()
+    return df.sort_values('id').reset_index(drop=True)
+
+def get_database_used_bytes(c):
+    """Bytes ocupados por dados no banco (sem contar as páginas livres)"""
+    c.execute("PRAGMA page_size")
+    page_size = c.fetchone()[0]
+    c.execute("PRAGMA page_count")
+    page_count = c.fetchone()[0]
+    c.execute("PRAGMA freelist_count")
+    return (page_count - c.fetchone()[0]) * page_size
+
+def time_hot_message_query(c):
+    """Tempo (ms) da leitura de todo o histórico recente do projeto com mais mensagens"""
+    c.execute("SELECT project_id FROM messages GROUP BY project_id ORDER BY COUNT(*) DESC LIMIT 1")
+    row = c.fetchone()
+    if row is None:
+        return 0.0
+    
+    start = time.perf_counter()
+    c.execute("""SELECT m.id, m.message, m.created_at, u.full_name
+                 FROM messages m
+                 JOIN users u ON m.from_user = u.id
+                 WHERE m.project_id = ?
+                 ORDER BY m.id""", row)
+    c.fetchall()
+    return (time.perf_counter() - start) * 1000
+
+def archive_messages(max_age_days=MESSAGE_ARCHIVE_DAYS):
+    """Move as mensagens mais antigas que max_age_days para o arquivo compactado por projeto e mês"""
+    # created_at é gravado em UTC (CURRENT_TIMESTAMP)
+    cutoff = (datetime.datetime.now(datetime.timezone.utc) - timedelta(days=max_age_days)).strftime('%Y-%m-%d %H:%M:%S')
+    
+    conn = sqlite3.connect('scpe.db', timeout=30)
+    c = conn.cursor()
+    report = {'used_bytes_before': get_database_used_bytes(c), 'hot_query_ms_before': time_hot_message_query(c)}
+    
+    c.execute("BEGIN IMMEDIATE")
+    c.execute("""SELECT id, project_id, from_user, message, created_at
+                 FROM messages WHERE created_at < ? ORDER BY id""", (cutoff,))
+    rows = c.fetchall()
+    
+    partitions = {}
+    for message_id, project_id, from_user, message, created_at in rows:
+        partitions.setdefault((project_id, created_at[:7]), []).append([message_id, from_user, message, created_at])
+    
+    for (project_id, month), messages in partitions.items():
+        c.execute("SELECT payload FROM message_archive WHERE project_id = ? AND month = ?", (project_id, month))
+        existing = c.fetchone()
+        if existing:
+            messages = sorted(json.loads(zlib.decompress(existing[0])) + messages)
         
-    except Exception as e:
-        st.error(f"❌ Erro na recriação: {e}")
-        # Tentativa alternativa mais simples
+        payload = zlib.compress(json.dumps(messages, ensure_ascii=False).encode('utf-8'), 9)
+        c.execute("""INSERT OR REPLACE INTO message_archive
+                     (project_id, month, first_id, last_id, message_count, payload)
+                     VALUES (?, ?, ?, ?, ?, ?)""",
+                  (project_id, month, messages[0][0], messages[-1][0], len(messages), payload))
+    
+    if rows:
+        c.execute("DELETE FROM messages WHERE created_at < ? AND id <= ?", (cutoff, rows[-1][0]))
+    conn.commit()
+    
+    report.update(archived_messages=len(rows),
+                  partitions=len(partitions),
+                  used_bytes_after=get_database_used_bytes(c),
+                  hot_query_ms_after=time_hot_message_query(c))
+    conn.close()
+    return report
+
+def get_message_archive_summary():
+    """Obtém o tamanho do arquivo de mensagens por projeto"""
+    conn = sqlite3.connect('scpe.db')
+    query = """SELECT a.project_id, p.name as project_name,
+                      COUNT(*) as months,
+                      SUM(a.message_count) as messages,
+                      SUM(LENGTH(a.payload)) as compressed_bytes
+               FROM message_archive a
+               LEFT JOIN projects p ON p.id = a.project_id
+               GROUP BY a.project_id
+               ORDER BY a.project_id"""
+    df = pd.read_sql_query(query, conn)
+    conn.close()
+    return df
+
+def render_message(msg):
+    """Exibe uma mensagem do chat"""
+    st.write(f"**{msg['from_user_name']}** ({msg['created_at']}):")
+    st.write(f"{msg['message']}")
+    st.divider()
+
+@st.fragment(run_every=CHAT_POLL_INTERVAL)
+def show_live_messages(project_id):
+    """Exibe as mensagens que chegaram depois da última renderização completa da página"""
+    buffer = get_chat_buffer(project_id)
+    # O fragmento redesenha toda a cauda a cada consulta; quando ela cresce demais, a
+    # página inteira é executada de novo e as mensagens passam para o histórico
+    if len(buffer['messages']) - buffer['rendered_count'] > CHAT_LIVE_MAX_MESSAGES:
+        st.rerun(scope="app")
+    
+    if not buffer['messages']:
+        st.info("Nenhuma mensagem neste projeto")
+    for msg in buffer['messages'][buffer['rendered_count']:]:
+        render_message(msg)
+# show
+
+def get_database_stats(snapshot=None):
+    """Obtém estatísticas leves do banco de dados, sem varrer as tabelas"""
+    conn = connect(snapshot)
+    c = conn.cursor()
+    
+    stats = {}
+    for pragma in ('page_size', 'page_count', 'freelist_count', 'journal_mode'):
+        c.execute(f"PRAGMA {pragma}")
+        stats[pragma] = c.fetchone()[0]
+    
+    stats['file_size'] = os.path.getsize('scpe.db')
+    stats['wal_size'] = os.path.getsize('scpe.db-wal') if os.path.exists('scpe.db-wal') else 0
+    
+    # Contagens estimadas e uso dos índices vêm de sqlite_stat1 (gerada pelo ANALYZE)
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+    has_stats = c.fetchone() is not None
+    
+    if has_stats:
+        stats['row_counts'] = pd.read_sql_query(
+            """SELECT m.name as tabela, MAX(CAST(s.stat AS INTEGER)) as linhas_estimadas
+               FROM sqlite_master m
+               LEFT JOIN sqlite_stat1 s ON s.tbl = m.name
+               WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+               GROUP BY m.name
+               ORDER BY m.name""", conn)
+        stats['indexes'] = pd.read_sql_query(
+            """SELECT m.name as indice, m.tbl_name as tabela, s.stat as estatistica
+               FROM sqlite_master m
+               LEFT JOIN sqlite_stat1 s ON s.idx = m.name
+               WHERE m.type = 'index'
+               ORDER BY m.tbl_name, m.name""", conn)
+    else:
+        stats['row_counts'] = pd.DataFrame()
+        stats['indexes'] = pd.read_sql_query(
+            """SELECT name as indice, tbl_name as tabela
+               FROM sqlite_master
+               WHERE type = 'index'
+               ORDER BY tbl_name, name""", conn)
+    
+    if snapshot is None:
+        conn.close()
+    return stats
+
+def run_analyze():
+    """Atualiza as estatísticas do banco (ANALYZE com amostragem limitada)"""
+    conn = sqlite3.connect('scpe.db')
+    conn.execute("PRAGMA analysis_limit = 1000")
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+@st.cache_resource
+def get_integrity_check_state():
+    """Estado da verificação de integridade, compartilhado entre execuções da página"""
+    return {'running': False, 'result': None, 'started_at': None, 'finished_at': None}
+
+def start_integrity_check():
+    """Inicia PRAGMA integrity_check em uma thread separada"""
+    state = get_integrity_check_state()
+    if state['running']:
+        return
+    
+    state.update(running=True, result=None, started_at=datetime.datetime.now(), finished_at=None)
+    
+    def run():
+        conn = sqlite3.connect('scpe.db')
         try:
-            c.execute("DROP TABLE IF EXISTS project_members")
-            c.execute('''CREATE TABLE project_members
-                         (project_id INTEGER,
-                          user_id INTEGER,
-                          role TEXT,
-                          assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                          PRIMARY KEY (project_id, user_id))''')
-            conn.commit()
-            st.success("✅ Tabela recriada (vazia)")
-            return True
-        except Exception as e2:
-            st.error(f"❌ Falha crítica: {e2}")
-            return False
+            result = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+        except Exception as e:
+            result = [f"Erro: {e}"]
+        finally:
+            conn.close()
+        state.update(running=False, result=result, finished_at=datetime.datetime.now())
+    
+    threading.Thread(target=run, daemon=True).start()
+
+def show_diagnostics():
+    """Diagnóstico do banco de dados para administradores"""
+    with read_snapshot() as snapshot:
+        stats = get_database_stats(snapshot)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Tamanho do Arquivo", f"{stats['file_size'] / 1024 / 1024:.2f} MB")
+    
+    with col2:
+        st.metric("Páginas", f"{stats['page_count']} x {stats['page_size']} B")
+    
+    with col3:
+        st.metric("Páginas Livres", stats['freelist_count'])
+    
+    with col4:
+        st.metric(f"WAL ({stats['journal_mode']})", f"{stats['wal_size'] / 1024:.1f} KB")
+    
+    st.write("**Linhas por tabela (estimativa do ANALYZE)**")
+    if not stats['row_counts'].empty:
+        st.dataframe(stats['row_counts'], use_container_width=True)
+    else:
+        st.info("Sem estatísticas. Execute o ANALYZE.")
+    
+    st.write("**Índices**")
+    st.dataframe(stats['indexes'], use_container_width=True)
+    
+    if st.button("📊 Executar ANALYZE"):
+        run_analyze()
+        st.rerun()
+    
+    # Verificação de integridade em segundo plano
+    st.write("**Verificação de Integridade**")
+    state = get_integrity_check_state()
+    
+    if state['running']:
+        st.info(f"⏳ Em execução desde {state['started_at']:%H:%M:%S}")
+        if st.button("🔄 Atualizar"):
+            st.rerun()
+    else:
+        if state['result'] == ['ok']:
+            st.success(f"✅ Banco íntegro (verificado em {state['finished_at']:%d/%m/%Y %H:%M:%S})")
+        elif state['result']:
+            st.error("❌ Problemas encontrados:")
+            st.write(state['result'])
+        
+        if st.button("🩺 Iniciar Verificação"):
+            start_integrity_check()
+            st.rerun()
+
+def probe_writer_stall(stop, samples):
+    """Mede quanto tempo um escritor espera pela trava de escrita enquanto o backup roda"""
+    conn = sqlite3.connect('scpe.db', timeout=30, isolation_level=None)
+    try:
+        while not stop.is_set():
+            start = time.perf_counter()
+            # Obtém a trava de escrita sem alterar o banco (alterações reiniciariam o backup)
+            conn.execute("BEGIN EXCLUSIVE")
+            conn.execute("ROLLBACK")
+            samples.append(time.perf_counter() - start)
+            stop.wait(0.05)
+    finally:
+        conn.close()
+
+def create_backup(kind='manual', apply_retention=True):
+    """Cria um snapshot do banco com a API de backup do SQLite, copiando poucas páginas por vez"""
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    created_at = datetime.datetime.now()
+    path = os.path.join(BACKUP_DIR, f"scpe-{created_at:%Y%m%d-%H%M%S-%f}.db")
+    
+    progress = {'remaining': None, 'pages': 0, 'restarts': 0}
+    
+    def on_progress(status, remaining, total):
+        # Se o banco for alterado por outra conexão, a cópia recomeça do início
+        if progress['remaining'] is not None and remaining > progress['remaining']:
+            progress['restarts'] += 1
+        progress.update(remaining=remaining, pages=total)
+        # O sleep da API de backup só é usado após SQLITE_BUSY/LOCKED: a pausa entre passos é esta
+        if remaining:
+            time.sleep(BACKUP_STEP_SLEEP)
+    
+    stop = threading.Event()
+    stall_samples = []
+    probe = threading.Thread(target=probe_writer_stall, args=(stop, stall_samples), daemon=True)
+    
+    src = sqlite3.connect('scpe.db', isolation_level=None)
+    dst = sqlite3.connect(path)
+    start = time.perf_counter()
+    probe.start()
+    try:
+        # Uma transação de leitura aberta prende a cópia a um snapshot do WAL: as escritas
+        # de outras conexões continuam, mas não reiniciam o backup
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        src.backup(dst, pages=BACKUP_PAGES_PER_STEP, progress=on_progress)
+        src.execute("ROLLBACK")
+    finally:
+        duration = time.perf_counter() - start
+        stop.set()
+        probe.join()
+        dst.close()
+        src.close()
+    
+    size_bytes = os.path.getsize(path)
+    backup = {
+        'file': path,
+        'kind': kind,
+        'created_at': created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'size_bytes': size_bytes,
+        'pages': progress['pages'],
+        'duration_seconds': duration,
+        'throughput_mb_s': size_bytes / 1024 / 1024 / duration if duration > 0 else 0,
+        'restarts': progress['restarts'],
+        'max_writer_stall_ms': max(stall_samples) * 1000 if stall_samples else 0,
+        'avg_writer_stall_ms': sum(stall_samples) / len(stall_samples) * 1000 if stall_samples else 0
+    }
+    
+    conn = sqlite3.connect('scpe.db')
+    conn.execute(f"INSERT INTO backups ({', '.join(backup)}) VALUES ({', '.join(['?'] * len(backup))})",
+                 list(backup.values()))
+    conn.commit()
+    conn.close()
+    
+    if apply_retention:
+        apply_backup_retention()
+    return backup
+
+def get_backups():
+    """Obtém o catálogo de backups, do mais recente para o mais antigo"""
+    conn = sqlite3.connect('scpe.db')
+    df = pd.read_sql_query("SELECT * FROM backups ORDER BY created_at DESC, id DESC", conn)
+    conn.close()
+    return df
+
+def apply_backup_retention():
+    """Remove os snapshots mais antigos além de BACKUP_RETENTION"""
+    conn = sqlite3.connect('scpe.db')
+    c = conn.cursor()
+    c.execute("SELECT id, file FROM backups ORDER BY created_at DESC, id DESC LIMIT -1 OFFSET ?",
+              (BACKUP_RETENTION,))
+    expired = c.fetchall()
+    for backup_id, path in expired:
+        if os.path.exists(path):
+            os.remove(path)
+        c.execute("DELETE FROM backups WHERE id = ?", (backup_id,))
+    conn.commit()
+    conn.close()
+
+def get_backup_tables(path):
+    """Obtém as tabelas restauráveis de um snapshot que também existem no banco atual"""
+    conn = sqlite3.connect('scpe.db')
+    conn.execute("ATTACH DATABASE ? AS snapshot", (path,))
+    c = conn.cursor()
+    c.execute("""SELECT s.name FROM snapshot.sqlite_master s
+                 JOIN main.sqlite_master m ON m.name = s.name AND m.type = 'table'
+                 WHERE s.type = 'table' AND s.name IN (SELECT value FROM json_each(?))
+                 ORDER BY s.name""", (json.dumps(RESTORABLE_TABLES),))
+    tables = [row[0] for row in c.fetchall()]
+    conn.close()
+    return tables
+
+def restore_backup(path, table=None):
+    """Restaura o banco inteiro ou apenas uma tabela a partir de um snapshot"""
+    if table:
+        if table not in RESTORABLE_TABLES:
+            raise ValueError(f"A tabela {table} não pode ser restaurada sozinha")
+        
+        conn = sqlite3.connect('scpe.db', timeout=30, isolation_level=None)
+        try:
+            conn.execute("ATTACH DATABASE ? AS snapshot", (path,))
+            columns = [row[1] for row in conn.execute(f'PRAGMA main.table_info("{table}")')]
+            snapshot_columns = {row[1] for row in conn.execute(f'PRAGMA snapshot.table_info("{table}")')}
+            columns = ', '.join(f'"{column}"' for column in columns if column in snapshot_columns)
+            
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f'DELETE FROM main."{table}"')
+            conn.execute(f'INSERT INTO main."{table}" ({columns}) SELECT {columns} FROM snapshot."{table}"')
+            # Os gatilhos de visibilidade tratam cada linha removida como um projeto excluído
+            if table in ('projects', 'project_members'):
+                rebuild_project_visibility(conn)
+            # Os baldes diários são refeitos desde o primeiro evento
+            conn.execute("DELETE FROM report_cursors WHERE name = 'task_events'")
+            conn.execute("DELETE FROM task_status_snapshot")
+            conn.execute("DELETE FROM task_daily_buckets")
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        
+        refresh_task_buckets()
+        refresh_summaries()
+        refresh_due_date_digests()
+        return
+    
+    # O catálogo de backups e o controle do agendador são preservados: descrevem arquivos
+    # e execuções atuais (uma trava running_since do snapshot bloquearia a tarefa por horas)
+    preserved = {'backups': get_backups(), 'scheduled_jobs': get_scheduled_jobs()}
+    
+    # Os contadores de alteração só avançam: voltar aos do snapshot faria a API repetir
+    # ETags já entregues para dados diferentes
+    conn = sqlite3.connect('scpe.db')
+    versions = conn.execute("SELECT table_name, version FROM table_versions").fetchall()
+    conn.close()
+    
+    snapshot = sqlite3.connect(path)
+    dst = sqlite3.connect('scpe.db', timeout=30)
+    try:
+        snapshot.backup(dst, pages=BACKUP_PAGES_PER_STEP)
     finally:
+        snapshot.close()
+        dst.close()
+    
+    init_db()
+    conn = sqlite3.connect('scpe.db')
+    for table, df in preserved.items():
+        conn.execute(f"DELETE FROM {table}")
+        df.to_sql(table, conn, if_exists='append', index=False)
+    conn.executemany("UPDATE table_versions SET version = MAX(version, ?) + 1 WHERE table_name = ?",
+                     [(version, table) for table, version in versions])
+    conn.commit()
+    conn.close()
+
+def refresh_summaries():
+    """Recalcula os resumos por projeto e os totais gerais lidos pelas páginas"""
+    now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn = sqlite3.connect('scpe.db', timeout=30)
+    c = conn.cursor()
+    
+    c.execute("BEGIN IMMEDIATE")
+    c.execute("DELETE FROM project_summary")
+    c.execute("""INSERT INTO project_summary (project_id, total_tasks, completed_tasks, total_hours, updated_at)
+                 SELECT p.id,
+                        COUNT(t.id),
+                        COALESCE(SUM(t.status = 'concluída'), 0),
+                        COALESCE(SUM(t.hours_worked), 0),
+                        ?
+                 FROM projects p
+                 LEFT JOIN tasks t ON t.project_id = p.id
+                 GROUP BY p.id""", (now,))
+    
+    # Modelos de projeto e suas tarefas não entram nos totais
+    c.execute("""SELECT (SELECT COUNT(*) FROM users),
+                        (SELECT COUNT(*) FROM users WHERE role = 'gerente'),
+                        (SELECT COUNT(*) FROM users WHERE role = 'membro'),
+                        (SELECT COUNT(*) FROM projects WHERE status != 'modelo'),
+                        (SELECT COUNT(*) FROM projects WHERE status = 'ativo'),
+                        (SELECT COALESCE(SUM(budget), 0) FROM projects WHERE status != 'modelo'),
+                        (SELECT COUNT(*) FROM tasks
+                         WHERE project_id NOT IN (SELECT id FROM projects WHERE status = 'modelo')),
+                        (SELECT COUNT(*) FROM tasks
+                         WHERE status = 'concluída'
+                           AND project_id NOT IN (SELECT id FROM projects WHERE status = 'modelo'))""")
+    names = ['total_users', 'managers', 'members', 'total_projects', 'active_projects',
+             'total_budget', 'total_tasks', 'completed_tasks']
+    # Só regrava os totais que mudaram, para o contador de versão (e o ETag de /metricas)
+    # não avançar a cada execução do agendador; updated_at marca a última alteração
+    c.executemany("""INSERT INTO system_summary (name, value, updated_at) VALUES (?, ?, ?)
+                     ON CONFLICT (name) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+                     WHERE value IS NOT excluded.value""",
+                  [(name, value, now) for name, value in zip(names, c.fetchone())])
+    conn.commit()
+    conn.close()
+
+def refresh_due_date_digests():
+    """Recalcula, para cada usuário, as tarefas não concluídas que vencem nos próximos 7 dias"""
+    conn = sqlite3.connect('scpe.db', timeout=30)
+    c = conn.cursor()
+    
+    c.execute("BEGIN IMMEDIATE")
+    c.execute("DELETE FROM due_date_digests")
+    c.execute("""INSERT INTO due_date_digests (user_id, task_id, project_name, description, end_date, assigned_name)
+                 SELECT v.user_id, t.id, p.name, t.description, t.end_date, u.full_name
+                 FROM tasks t
+                 JOIN projects p ON p.id = t.project_id
+                 JOIN project_visibility v ON v.project_id = t.project_id
+                 LEFT JOIN users u ON u.id = t.assigned_to
+                 WHERE t.status != 'concluída' AND p.status != 'modelo'
+                   AND t.end_date <= date('now', 'localtime', '+7 days')""")
+    conn.commit()
+    conn.close()
+
+def get_due_date_digest(user_id, snapshot=None):
+    """Obtém as tarefas próximas do prazo pré-calculadas para o usuário"""
+    conn = connect(snapshot)
+    df = pd.read_sql_query(QUERIES['prazos_usuario'], conn, params=(int(user_id),))
+    if snapshot is None:
+        conn.close()
+    return df
+
+def get_project_summaries():
+    """Obtém os resumos pré-calculados de todos os projetos, indexados pelo id do projeto"""
+    conn = sqlite3.connect('scpe.db')
+    df = pd.read_sql_query("SELECT * FROM project_summary", conn, index_col='project_id')
+    conn.close()
+    return df
+
+def get_system_summary(snapshot=None):
+    """Obtém os totais gerais pré-calculados"""
+    conn = connect(snapshot)
+    c = conn.cursor()
+    c.execute("SELECT name, value, updated_at FROM system_summary")
+    rows = c.fetchall()
+    if snapshot is None:
         conn.close()
+    
+    summary = {name: value for name, value, _ in rows}
+    summary['updated_at'] = max((updated_at for _, _, updated_at in rows), default=None)
+    return summary
+
+# Tarefas periódicas: nome -> (intervalo em segundos, função)
+SCHEDULED_JOBS = {
+    'resumos': (60, refresh_summaries),
+    'baldes_tarefas': (60, refresh_task_buckets),
+    'alertas_prazo': (300, refresh_due_date_digests),
+    'analyze': (24 * 3600, run_analyze),
+    'backup': (BACKUP_INTERVAL_HOURS * 3600, lambda: create_backup(kind='agendado')),
+    'arquivo_mensagens': (24 * 3600, archive_messages)
+}
+
+def run_scheduled_job(name, force=False):
+    """Executa uma tarefa agendada se ela estiver no prazo e não houver outra execução em andamento"""
+    interval, job = SCHEDULED_JOBS[name]
+    now = datetime.datetime.now()
+    due = (now - timedelta(seconds=interval)).strftime('%Y-%m-%d %H:%M:%S')
+    stale = (now - timedelta(seconds=SCHEDULER_LEASE_TIMEOUT)).strftime('%Y-%m-%d %H:%M:%S')
+    started_at = now.strftime('%Y-%m-%d %H:%M:%S')
+    
+    # A marca running_since é a trava: vale entre threads e entre processos
+    conn = sqlite3.connect('scpe.db', timeout=30)
+    c = conn.cursor()
+    c.execute("INSERT OR IGNORE INTO scheduled_jobs (name) VALUES (?)", (name,))
+    c.execute("""UPDATE scheduled_jobs SET running_since = ?, last_started_at = ?
+                 WHERE name = ?
+                   AND (? OR last_started_at IS NULL OR last_started_at <= ?)
+                   AND (running_since IS NULL OR running_since < ?)""",
+              (started_at, started_at, name, force, due, stale))
+    acquired = c.rowcount == 1
+    if not acquired:
+        c.execute("""UPDATE scheduled_jobs SET skipped_overlaps = skipped_overlaps + 1
+                     WHERE name = ? AND running_since IS NOT NULL
+                       AND (? OR last_started_at <= ?)""", (name, force, due))
+    conn.commit()
+    conn.close()
+    
+    if not acquired:
+        return False
+    
+    error = None
+    start = time.perf_counter()
+    try:
+        job()
+    except Exception as e:
+        error = str(e)
+    duration = time.perf_counter() - start
+    
+    conn = sqlite3.connect('scpe.db', timeout=30)
+    conn.execute("""UPDATE scheduled_jobs SET
+                        running_since = NULL,
+                        last_finished_at = ?,
+                        last_duration_seconds = ?,
+                        avg_duration_seconds = (COALESCE(avg_duration_seconds, 0) * runs + ?) / (runs + 1),
+                        max_duration_seconds = MAX(COALESCE(max_duration_seconds, 0), ?),
+                        runs = runs + 1,
+                        failures = failures + ?,
+                        last_error = COALESCE(?, last_error)
+                    WHERE name = ?""",
+                 (datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), duration, duration, duration,
+                  int(error is not None), error, name))
+    conn.commit()
+    conn.close()
+    return True
+
+@st.cache_resource
+def start_scheduler():
+    """Inicia, uma vez por processo, a thread que dispara as tarefas periódicas
+    
+    Devolve o estado da thread, com a última falha do próprio agendador (as falhas das
+    tarefas ficam em scheduled_jobs).
+    """
+    state = {'errors': 0, 'last_error': None, 'last_error_at': None}
+    
+    def run():
+        while True:
+            try:
+                conn = sqlite3.connect('scpe.db')
+                last_started = dict(conn.execute("SELECT name, last_started_at FROM scheduled_jobs"))
+                conn.close()
+                
+                now = datetime.datetime.now()
+                for name, (interval, _) in SCHEDULED_JOBS.items():
+                    last = last_started.get(name)
+                    if last is None or datetime.datetime.fromisoformat(last) <= now - timedelta(seconds=interval):
+                        # Cada execução em sua própria thread: uma tarefa lenta não atrasa as outras
+                        threading.Thread(target=run_scheduled_job, args=(name,), daemon=True).start()
+            except Exception as e:
+                state.update(errors=state['errors'] + 1, last_error=str(e), last_error_at=datetime.datetime.now())
+            time.sleep(SCHEDULER_TICK)
+    
+    threading.Thread(target=run, daemon=True).start()
+    return state
+
+def get_scheduled_jobs():
+    """Obtém as métricas de execução das tarefas agendadas"""
+    conn = sqlite3.connect('scpe.db')
+    df = pd.read_sql_query("SELECT * FROM scheduled_jobs ORDER BY name", conn)
+    conn.close()
+    return df
+
+def show_scheduler():
+    """Métricas e execução manual das tarefas agendadas"""
+    jobs = get_scheduled_jobs()
+    
+    if not jobs.empty:
+        jobs['intervalo_segundos'] = jobs['name'].map(lambda name: SCHEDULED_JOBS[name][0]
+                                                     if name in SCHEDULED_JOBS else None)
+        st.dataframe(jobs, use_container_width=True)
+    else:
+        st.info("Nenhuma tarefa executada ainda")
+    
+    scheduler = start_scheduler()
+    if scheduler['last_error']:
+        st.warning(f"⚠️ Falhas do agendador: {scheduler['errors']} (última em "
+                   f"{scheduler['last_error_at']:%Y-%m-%d %H:%M:%S}: {scheduler['last_error']})")
+    
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        job_name = st.selectbox("Tarefa", list(SCHEDULED_JOBS.keys()))
+    with col2:
+        if st.button("▶️ Executar Agora"):
+            threading.Thread(target=run_scheduled_job, args=(job_name,), kwargs={'force': True},
+                             daemon=True).start()
+            st.success(f"✅ {job_name} iniciada")
+
+def show_message_archive():
+    """Arquivamento de mensagens antigas"""
+    st.write(f"Mensagens com mais de {MESSAGE_ARCHIVE_DAYS} dias são movidas diariamente para o arquivo "
+             f"compactado e continuam acessíveis no histórico de cada projeto.")
+    
+    if st.button("🗄️ Arquivar Agora"):
+        with st.spinner("Arquivando mensagens..."):
+            report = archive_messages()
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Mensagens Arquivadas", report['archived_messages'], f"{report['partitions']} blocos mensais",
+                      delta_color="off")
+        with col2:
+            st.metric("Dados no Banco", f"{report['used_bytes_after'] / 1024 / 1024:.2f} MB",
+                      f"{(report['used_bytes_after'] - report['used_bytes_before']) / 1024 / 1024:.2f} MB",
+                      delta_color="inverse")
+        with col3:
+            st.metric("Leitura do Histórico Recente", f"{report['hot_query_ms_after']:.1f} ms",
+                      f"{report['hot_query_ms_after'] - report['hot_query_ms_before']:.1f} ms",
+                      delta_color="inverse")
+    
+    archive = get_message_archive_summary()
+    if not archive.empty:
+        st.dataframe(archive, use_container_width=True)
+    else:
+        st.info("Nenhuma mensagem arquivada")
+
+def show_backups():
+    """Backups do banco de dados e restauração a partir de um snapshot"""
+    if st.button("💾 Criar Backup Agora"):
+        with st.spinner("Copiando banco de dados..."):
+            backup = create_backup()
+        st.success(f"✅ Backup criado: {backup['file']} "
+                   f"({backup['throughput_mb_s']:.1f} MB/s, espera máxima de escrita "
+                   f"{backup['max_writer_stall_ms']:.1f} ms)")
+    
+    backups = get_backups()
+    
+    if backups.empty:
+        st.info("Nenhum backup criado")
+        return
+    
+    st.write(f"**Snapshots** (mantidos os {BACKUP_RETENTION} mais recentes, "
+             f"agendados a cada {BACKUP_INTERVAL_HOURS} h)")
+    st.dataframe(backups.drop(columns=['id']), use_container_width=True)
+    
+    # Restauração
+    st.write("**Restaurar**")
+    backup_options = {f"{row['created_at']} ({row['kind']})": row['file'] for _, row in backups.iterrows()}
+    selected_backup = st.selectbox("Snapshot", list(backup_options.keys()))
+    path = backup_options[selected_backup]
+    
+    if not os.path.exists(path):
+        st.error("❌ Arquivo do snapshot não encontrado")
+        return
+    
+    target = st.selectbox("Restaurar", ["Banco completo"] + get_backup_tables(path))
+    confirm = st.checkbox("Confirmo que os dados atuais serão substituídos pelos do snapshot")
+    
+    if st.button("♻️ Restaurar", disabled=not confirm):
+        # Snapshot de segurança do estado atual antes de sobrescrever
+        create_backup(kind='pré-restauração', apply_retention=False)
+        restore_backup(path, table=None if target == "Banco completo" else target)
+        apply_backup_retention()
+        st.success(f"✅ {target} restaurado a partir de {selected_backup}")
 
 # Interface principal
 def main():
     # Inicializar banco de dados
     init_db()
+    start_scheduler()
     
     # Sistema de autenticação
     if 'user' not in st.session_state:
@@ -397,6 +2071,9 @@ def show_main_application():
         "📈 Dashboard",
         "📋 Projetos", 
         "✅ Tarefas",
+        "⏱️ Horas",
+        "📅 Cronograma",
+        "🧮 Capacidade",
         "👥 Equipes",
         "💬 Comunicação",
         "📊 Relatórios"
@@ -419,6 +2096,12 @@ def show_main_application():
         show_projects()
     elif choice == "✅ Tarefas":
         show_tasks()
+    elif choice == "⏱️ Horas":
+        show_timesheet()
+    elif choice == "📅 Cronograma":
+        show_timeline()
+    elif choice == "🧮 Capacidade":
+        show_capacity()
     elif choice == "👥 Equipes":
         show_teams()
     elif choice == "💬 Comunicação":
@@ -432,9 +2115,12 @@ def show_dashboard():
     """Dashboard principal"""
     st.title("📈 Dashboard")
     
-    # Obter dados
-    projects = get_projects(st.session_state.user['id'])
-    tasks = get_tasks()
+    # Obter dados (todos do mesmo snapshot somente leitura)
+    with read_snapshot() as snapshot:
+        projects = get_projects(st.session_state.user['id'], columns=['id', 'status'], snapshot=snapshot,
+                                include_templates=False)
+        tasks = get_tasks(columns=['status'], snapshot=snapshot)
+        upcoming_tasks = get_due_date_digest(st.session_state.user['id'], snapshot)
     
     # Métricas principais
     col1, col2, col3, col4 = st.columns(4)
@@ -475,14 +2161,10 @@ def show_dashboard():
         else:
             st.info("Nenhuma tarefa cadastrada")
     
-    # Tarefas próximas do prazo
+    # Tarefas próximas do prazo (pré-calculadas pelo agendador)
     st.subheader("📅 Tarefas Próximas do Prazo")
     if not tasks.empty:
-        tasks['end_date'] = pd.to_datetime(tasks['end_date'])
-        upcoming_tasks = tasks[
-            (tasks['status'] != 'concluída') & 
-            (tasks['end_date'] <= datetime.datetime.now() + timedelta(days=7))
-        ]
+        upcoming_tasks['end_date'] = pd.to_datetime(upcoming_tasks['end_date'])
         
         if not upcoming_tasks.empty:
             for _, task in upcoming_tasks.iterrows():
@@ -531,10 +2213,50 @@ def show_projects():
                         st.rerun()
                     else:
                         st.error("Preencha os campos obrigatórios (*)")
+        
+        # Modelos e cópia de projetos existentes
+        with st.expander("📑 Modelos e Clonagem"):
+            sources = get_projects(st.session_state.user['id'], columns=['id', 'name', 'status'])
+            
+            if not sources.empty:
+                with st.form("clone_form"):
+                    # Modelos aparecem primeiro
+                    sources = sources.assign(is_template=sources['status'] == 'modelo') \
+                                     .sort_values(['is_template', 'name'], ascending=[False, True])
+                    source_options = {(f"📑 {row['name']}" if row['is_template'] else row['name']): row['id']
+                                      for _, row in sources.iterrows()}
+                    source_name = st.selectbox("Modelo ou Projeto de Origem*", list(source_options.keys()))
+                    
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        clone_name = st.text_input("Nome do Novo Projeto*")
+                        clone_start = st.date_input("Início da Primeira Tarefa*")
+                    with col2:
+                        copy_members = st.checkbox("Copiar equipe", value=True)
+                        as_template = st.checkbox("Salvar como modelo")
+                    
+                    if st.form_submit_button("📑 Clonar"):
+                        if clone_name:
+                            try:
+                                clone_project(source_options[source_name], clone_name, clone_start,
+                                              st.session_state.user['id'],
+                                              status='modelo' if as_template else 'ativo',
+                                              copy_members=copy_members)
+                                st.success("✅ Projeto clonado com sucesso!")
+                                st.rerun()
+                            except Exception as e:
+                                st.error(f"❌ Erro ao clonar projeto: {str(e)}")
+                        else:
+                            st.error("Preencha os campos obrigatórios (*)")
+            else:
+                st.info("Nenhum projeto disponível para clonar")
     
     # Lista de projetos
     st.subheader("📂 Projetos")
-    projects = get_projects(st.session_state.user['id'])
+    projects = get_projects(st.session_state.user['id'],
+                            columns=['id', 'name', 'description', 'client', 'budget', 'total_deadline',
+                                     'status', 'created_at', 'manager_name'])
+    summaries = get_project_summaries()
     
     if not projects.empty:
         for _, project in projects.iterrows():
@@ -548,14 +2270,16 @@ def show_projects():
                 
                 with col2:
                     st.write(f"**Orçamento:** R$ {project['budget']:,.2f}")
-                    st.write(f"**Prazo:** {project['total_deadline']}")
-                    st.write(f"**Criado em:** {project['created_at']}")
+                    st.write(f"**Prazo:** {format_date(project['total_deadline'])}")
+                    st.write(f"**Criado em:** {format_date(project['created_at'], '%Y-%m-%d %H:%M:%S')}")
                 
                 with col3:
-                    # Estatísticas do projeto
-                    project_tasks = get_tasks(project['id'])
-                    total_tasks = len(project_tasks)
-                    completed_tasks = len(project_tasks[project_tasks['status'] == 'concluída'])
+                    # Estatísticas do projeto (pré-calculadas pelo agendador)
+                    if project['id'] in summaries.index:
+                        total_tasks = summaries.at[project['id'], 'total_tasks']
+                        completed_tasks = summaries.at[project['id'], 'completed_tasks']
+                    else:
+                        total_tasks = completed_tasks = 0
                     completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
                     
                     st.write(f"**Progresso:** {completion_rate:.1f}%")
@@ -576,86 +2300,62 @@ def manage_project_team(project_id):
     st.subheader("👥 Gerenciar Equipe do Projeto")
     
     # Obter informações do projeto
-    projects = get_projects()
+    projects = get_projects(columns=['id', 'name'])
     project = projects[projects['id'] == project_id].iloc[0]
     st.write(f"**Projeto:** {project['name']} (ID: {project_id})")
     
-    users = get_users()
-    
-    # DIAGNÓSTICO
-    st.write("---")
-    debug_database_state()
-    
-    # SOLUÇÃO DE EMERGÊNCIA
-    st.write("---")
-    st.write("### 🚨 SOLUÇÃO DE EMERGÊNCIA")
-    
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        if st.button("🔄 RECRIAR TABELA COMPLETA", type="primary"):
-            if emergency_recreate_project_members():
-                time.sleep(2)
-                st.rerun()
-    
-    with col2:
-        if st.button("🧹 LIMPAR E RECRIAR"):
-            conn = sqlite3.connect('scpe.db')
-            c = conn.cursor()
-            c.execute("DROP TABLE IF EXISTS project_members")
-            c.execute('''CREATE TABLE project_members
-                         (project_id INTEGER,
-                          user_id INTEGER,
-                          role TEXT,
-                          assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                          PRIMARY KEY (project_id, user_id))''')
-            conn.commit()
-            conn.close()
-            st.success("✅ Tabela limpa e recriada do zero!")
-            st.rerun()
-    
     # ADICIONAR MEMBRO
     st.write("---")
     st.write("### ➕ Adicionar Membro à Equipe")
     
+    # Busca fora do formulário para atualizar as sugestões a cada termo digitado
+    search_term = st.text_input("Buscar usuário (nome ou login)", key=f"member_search_{project_id}")
+    candidates = search_users(search_term, exclude_project_id=project_id)
+    
+    if search_term and candidates.empty:
+        st.info("Nenhum usuário encontrado fora da equipe")
+    
     with st.form("add_member_form"):
-        user_to_add = st.selectbox("Selecionar Usuário", users['full_name'].tolist())
+        user_options = {f"{row['full_name']} ({row['username']})": row['id'] for _, row in candidates.iterrows()}
+        user_to_add = st.selectbox("Selecionar Usuário", list(user_options.keys()))
         role = st.selectbox("Função no Projeto", ["Desenvolvedor", "Designer", "Analista", "Testador"])
         
         if st.form_submit_button("🎯 ADICIONAR MEMBRO"):
-            user_id = users[users['full_name'] == user_to_add]['id'].iloc[0]
-            
-            try:
-                conn = sqlite3.connect('scpe.db')
-                c = conn.cursor()
-                
-                # Inserção direta
-                c.execute(
-                    "INSERT INTO project_members (project_id, user_id, role) VALUES (?, ?, ?)",
-                    (project_id, user_id, role)
-                )
-                
-                conn.commit()
+            if user_to_add is None:
+                st.error("❌ Busque e selecione um usuário")
+            else:
+                user_id = int(user_options[user_to_add])
                 
-                # Verificação imediata
-                c.execute("SELECT * FROM project_members WHERE project_id = ? AND user_id = ?", 
-                         (project_id, user_id))
-                result = c.fetchone()
-                
-                conn.close()
-                
-                if result:
-                    st.success(f"✅ **SUCESSO!** {user_to_add} adicionado à equipe!")
-                    st.balloons()
-                    time.sleep(2)
-                    st.rerun()
-                else:
-                    st.error("❌ **FALHA:** Inserção não funcionou!")
+                try:
+                    conn = sqlite3.connect('scpe.db')
+                    c = conn.cursor()
                     
-            except sqlite3.IntegrityError:
-                st.error(f"❌ {user_to_add} já é membro deste projeto!")
-            except Exception as e:
-                st.error(f"❌ Erro: {str(e)}")
+                    # Inserção direta
+                    c.execute(
+                        "INSERT INTO project_members (project_id, user_id, role) VALUES (?, ?, ?)",
+                        (project_id, user_id, role)
+                    )
+                    
+                    conn.commit()
+                    
+                    # Verificação imediata
+                    c.execute(QUERIES['membro_do_projeto'], (project_id, user_id))
+                    result = c.fetchone()
+                    
+                    conn.close()
+                    
+                    if result:
+                        st.success(f"✅ **SUCESSO!** {user_to_add} adicionado à equipe!")
+                        st.balloons()
+                        time.sleep(2)
+                        st.rerun()
+                    else:
+                        st.error("❌ **FALHA:** Inserção não funcionou!")
+                        
+                except sqlite3.IntegrityError:
+                    st.error(f"❌ {user_to_add} já é membro deste projeto!")
+                except Exception as e:
+                    st.error(f"❌ Erro: {str(e)}")
     
     # VERIFICAÇÃO DOS MEMBROS
     st.write("---")
@@ -664,15 +2364,14 @@ def manage_project_team(project_id):
     # Busca direta do banco
     conn = sqlite3.connect('scpe.db')
     try:
-        direct_query = "SELECT * FROM project_members WHERE project_id = ?"
-        members_data = pd.read_sql_query(direct_query, conn, params=(project_id,))
+        members_data = pd.read_sql_query(QUERIES['membros_equipe'], conn, params=(project_id,))
         
         if not members_data.empty:
             st.success(f"🎉 **MEMBROS ENCONTRADOS:** {len(members_data)}")
             
             # Buscar nomes dos usuários
             user_ids = members_data['user_id'].tolist()
-            users_query = f"SELECT id, full_name FROM users WHERE id IN ({','.join(['?']*len(user_ids))})"
+            users_query = QUERIES['nomes_usuarios'].format(placeholders=','.join(['?'] * len(user_ids)))
             users_info = pd.read_sql_query(users_query, conn, params=user_ids)
             
             # Juntar informações
@@ -714,19 +2413,18 @@ def manage_project_team(project_id):
         st.rerun()
 
 def show_teams():
-    """Gerenciamento de equipes - VERSÃO CORRIGIDA"""
+    """Gerenciamento de equipes"""
     st.title("👥 Gerenciamento de Equipes")
     
-    # Obter projetos onde o usuário atual é membro
-    user_projects = get_user_projects(st.session_state.user['id'])
+    # Todas as equipes dos projetos do usuário em uma única consulta
+    rosters = get_team_rosters(st.session_state.user['id'])
     
-    if not user_projects.empty:
+    if rosters:
         st.subheader("📋 Meus Projetos e Equipes")
         
-        for _, project in user_projects.iterrows():
+        for project in rosters.values():
             with st.expander(f"🏢 {project['name']} - Equipe Completa"):
-                # Obter todos os membros do projeto usando a função corrigida
-                members = get_project_members(project['id'])
+                members = project['members']
                 
                 if not members.empty:
                     st.write(f"**Total de membros:** {len(members)}")
@@ -736,7 +2434,7 @@ def show_teams():
                     st.write(f"**{project['manager_name']}** (Gerente)")
                     
                     # Exibir outros membros da equipe
-                    other_members = members[members['full_name'] != project['manager_name']]
+                    other_members = members[~members['is_manager']]
                     
                     if not other_members.empty:
                         st.write("### 👥 Membros da Equipe")
@@ -755,34 +2453,6 @@ def show_teams():
                         st.info("Não há outros membros na equipe além do gerente")
                 else:
                     st.info("Nenhum membro na equipe deste projeto")
-                    
-                    # DEBUG: Mostrar por que não está encontrando membros
-                    st.write("---")
-                    st.write("**🔍 DEBUG:** Verificando dados no banco...")
-                    
-                    conn = sqlite3.connect('scpe.db')
-                    try:
-                        # Verificar se há membros na tabela project_members
-                        check_query = "SELECT * FROM project_members WHERE project_id = ?"
-                        check_data = pd.read_sql_query(check_query, conn, params=(project['id'],))
-                        
-                        if not check_data.empty:
-                            st.write("**Dados encontrados em project_members:**")
-                            st.write(check_data)
-                            
-                            # Verificar usuários correspondentes
-                            user_ids = check_data['user_id'].tolist()
-                            if user_ids:
-                                users_query = f"SELECT id, full_name FROM users WHERE id IN ({','.join(['?']*len(user_ids))})"
-                                users_data = pd.read_sql_query(users_query, conn, params=user_ids)
-                                st.write("**Usuários correspondentes:**")
-                                st.write(users_data)
-                        else:
-                            st.write("**Nenhum dado encontrado em project_members para este projeto**")
-                    except Exception as e:
-                        st.error(f"Erro no debug: {e}")
-                    finally:
-                        conn.close()
     else:
         st.info("Você não está em nenhum projeto como membro da equipe")
 
@@ -792,7 +2462,7 @@ def show_tasks():
     
     # Formulário para adicionar tarefa
     with st.expander("➕ Adicionar Nova Tarefa"):
-        projects = get_projects(st.session_state.user['id'])
+        projects = get_projects(st.session_state.user['id'], columns=['id', 'name'], include_templates=False)
         
         if not projects.empty:
             with st.form("task_form"):
@@ -810,7 +2480,7 @@ def show_tasks():
                     end_date = st.date_input("Data de Término*")
                 
                 status = st.selectbox("Status*", ["pendente", "em andamento", "concluída"])
-                hours_worked = st.number_input("Horas Trabalhadas", min_value=0.0, value=0.0, step=0.5)
+                hours_worked = st.number_input("Horas Trabalhadas (hoje)", min_value=0.0, value=0.0, step=0.5)
                 
                 # Usar o usuário atual como responsável
                 assigned_to = st.session_state.user['id']
@@ -827,7 +2497,11 @@ def show_tasks():
                             c.execute("""INSERT INTO tasks 
                                         (project_id, description, start_date, end_date, status, assigned_to, hours_worked)
                                         VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                                    (project_id, description, start_date, end_date, status, assigned_to, hours_worked))
+                                    (project_id, description, start_date, end_date, status, assigned_to, 0))
+                            task_id = c.lastrowid
+                            if hours_worked > 0:
+                                add_time_entry(c, task_id, st.session_state.user['id'], datetime.date.today(), hours_worked)
+                            log_task_event(c, task_id, project_id, status, hours_worked, st.session_state.user['id'])
                             conn.commit()
                             conn.close()
                             st.success("✅ Tarefa criada com sucesso!")
@@ -840,7 +2514,8 @@ def show_tasks():
     
     # Lista de tarefas
     st.subheader("📝 Lista de Tarefas")
-    tasks = get_tasks()
+    tasks = get_tasks(columns=['id', 'project_id', 'description', 'start_date', 'end_date', 'status',
+                               'hours_worked', 'assigned_name', 'project_name'])
     
     if not tasks.empty:
         # Filtros
@@ -873,6 +2548,49 @@ def show_tasks():
         # Exibir tarefas
         st.write(f"**Total de tarefas encontradas:** {len(filtered_tasks)}")
         
+        # Ações em lote sobre as tarefas filtradas
+        with st.expander("🗂️ Ações em Lote"):
+            task_labels = {f"#{row['id']} {row['description']} - {row['project_name']}": row['id']
+                           for _, row in filtered_tasks.iterrows()}
+            select_all = st.checkbox("Selecionar todas as tarefas filtradas")
+            selected_labels = st.multiselect("Tarefas", list(task_labels.keys()),
+                                             default=list(task_labels.keys()) if select_all else [])
+            
+            bulk_actions = {
+                "Alterar status": 'status',
+                "Reatribuir responsável": 'reassign',
+                "Lançar horas (hoje)": 'hours',
+                "Mover prazo": 'deadline'
+            }
+            bulk_action = bulk_actions[st.selectbox("Ação", list(bulk_actions.keys()))]
+            
+            if bulk_action == 'status':
+                bulk_value = st.selectbox("Novo Status", ["pendente", "em andamento", "concluída"], key="bulk_status")
+            elif bulk_action == 'reassign':
+                # Busca indexada em vez da lista completa; as opções são ids (nomes podem se repetir)
+                search_term = st.text_input("Buscar responsável (nome ou login)", key="bulk_assignee_search")
+                candidates = search_users(search_term)
+                user_labels = {row['id']: f"{row['full_name']} ({row['username']})" for _, row in candidates.iterrows()}
+                bulk_value = st.selectbox("Novo Responsável", list(user_labels.keys()), format_func=user_labels.get)
+                if search_term and candidates.empty:
+                    st.info("Nenhum usuário encontrado")
+            elif bulk_action == 'hours':
+                bulk_value = st.number_input("Horas por tarefa", min_value=0.5, value=1.0, step=0.5)
+            else:
+                bulk_value = st.number_input("Dias (negativo antecipa)", value=7, step=1)
+            
+            if st.button(f"Aplicar a {len(selected_labels)} tarefa(s)",
+                         disabled=not selected_labels or bulk_value is None):
+                selected_ids = [task_labels[label] for label in selected_labels]
+                selected_tasks = filtered_tasks[filtered_tasks['id'].isin(selected_ids)]
+                try:
+                    updated = bulk_update_tasks(selected_tasks, bulk_action, bulk_value, st.session_state.user['id'])
+                    st.success(f"✅ {updated} tarefa(s) atualizada(s)!")
+                    time.sleep(1)
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"❌ Erro ao atualizar tarefas: {str(e)}")
+        
         for _, task in filtered_tasks.iterrows():
             status_color = {
                 "pendente": "🔴",
@@ -889,8 +2607,8 @@ def show_tasks():
                     st.write(f"**Status:** {task['status']}")
                 
                 with col2:
-                    st.write(f"**Início:** {task['start_date']}")
-                    st.write(f"**Término:** {task['end_date']}")
+                    st.write(f"**Início:** {format_date(task['start_date'])}")
+                    st.write(f"**Término:** {format_date(task['end_date'])}")
                     st.write(f"**Horas Trabalhadas:** {task['hours_worked']}")
                 
                 with col3:
@@ -900,16 +2618,20 @@ def show_tasks():
                                             index=["pendente", "em andamento", "concluída"].index(task['status']),
                                             key=f"status_{task['id']}")
                     
-                    new_hours = st.number_input("Horas Trabalhadas", 
-                                              value=float(task['hours_worked']),
+                    new_hours = st.number_input("Lançar Horas (hoje)", 
+                                              min_value=0.0, value=0.0, step=0.5,
                                               key=f"hours_{task['id']}")
                     
                     if st.button("Atualizar", key=f"update_{task['id']}"):
                         try:
                             conn = sqlite3.connect('scpe.db')
                             c = conn.cursor()
-                            c.execute("UPDATE tasks SET status = ?, hours_worked = ? WHERE id = ?",
-                                     (new_status, new_hours, task['id']))
+                            c.execute(QUERIES['atualizar_status_tarefa'], (new_status, task['id']))
+                            if new_hours > 0:
+                                add_time_entry(c, task['id'], st.session_state.user['id'],
+                                               datetime.date.today(), new_hours)
+                            log_task_event(c, task['id'], task['project_id'], new_status,
+                                           task['hours_worked'] + new_hours, st.session_state.user['id'])
                             conn.commit()
                             conn.close()
                             st.success("✅ Tarefa atualizada!")
@@ -920,17 +2642,261 @@ def show_tasks():
     else:
         st.info("📭 Nenhuma tarefa encontrada")
 
+def show_timesheet():
+    """Apontamento e folha de horas por usuário"""
+    st.title("⏱️ Apontamento de Horas")
+    
+    user_id = st.session_state.user['id']
+    
+    # Gerentes podem consultar a folha de horas de outros usuários
+    if st.session_state.user['role'] == 'gerente':
+        users = get_users()
+        user_options = {f"{row['full_name']} ({row['username']})": row['id'] for _, row in users.iterrows()}
+        current = next(name for name, uid in user_options.items() if uid == user_id)
+        selected_user = st.selectbox("Usuário", list(user_options.keys()),
+                                     index=list(user_options.keys()).index(current))
+        user_id = user_options[selected_user]
+    
+    # Lançar horas
+    if user_id == st.session_state.user['id']:
+        with st.expander("➕ Lançar Horas"):
+            tasks = get_tasks(columns=['id', 'description', 'project_name'], assigned_to=user_id)
+            
+            if not tasks.empty:
+                with st.form("time_entry_form"):
+                    task_options = {f"{row['description']} - {row['project_name']}": row['id']
+                                    for _, row in tasks.iterrows()}
+                    selected_task = st.selectbox("Tarefa*", list(task_options.keys()))
+                    
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        day = st.date_input("Dia*", value=datetime.date.today())
+                    with col2:
+                        hours = st.number_input("Horas*", min_value=0.0, value=1.0, step=0.5)
+                    
+                    if st.form_submit_button("Lançar"):
+                        if hours > 0:
+                            conn = sqlite3.connect('scpe.db')
+                            c = conn.cursor()
+                            task_id = task_options[selected_task]
+                            add_time_entry(c, task_id, user_id, day, hours)
+                            log_current_task_events(c, [task_id], user_id)
+                            conn.commit()
+                            conn.close()
+                            st.success("✅ Horas lançadas!")
+                            st.rerun()
+                        else:
+                            st.error("❌ Informe a quantidade de horas")
+            else:
+                st.info("Nenhuma tarefa atribuída a você")
+    
+    # Período da folha de horas
+    col1, col2 = st.columns(2)
+    with col1:
+        start_date = st.date_input("De", value=datetime.date.today() - timedelta(days=90))
+    with col2:
+        end_date = st.date_input("Até", value=datetime.date.today())
+    
+    entries = get_time_entries(user_id, start_date, end_date)
+    
+    if not entries.empty:
+        st.metric("Total no Período", f"{entries['hours'].sum():.1f} h")
+        
+        tab1, tab2, tab3 = st.tabs(["Semanal", "Mensal", "Lançamentos"])
+        
+        with tab1:
+            weekly = get_timesheet_rollup(user_id, start_date, end_date, period='week')
+            st.bar_chart(weekly.set_index('period')['hours'])
+            st.dataframe(weekly, use_container_width=True)
+        
+        with tab2:
+            monthly = get_timesheet_rollup(user_id, start_date, end_date, period='month')
+            st.bar_chart(monthly.set_index('period')['hours'])
+            st.dataframe(monthly, use_container_width=True)
+        
+        with tab3:
+            st.dataframe(entries, use_container_width=True)
+    else:
+        st.info("Nenhum lançamento de horas no período")
+
+def show_timeline():
+    """Cronograma das tarefas por responsável"""
+    st.title("📅 Cronograma")
+    
+    projects = get_projects(st.session_state.user['id'], columns=['id', 'name'], include_templates=False)
+    
+    if projects.empty:
+        st.info("Você não está em nenhum projeto")
+        return
+    
+    project_options = {row['name']: row['id'] for _, row in projects.iterrows()}
+    selected_project_name = st.selectbox("Selecionar Projeto", list(project_options.keys()))
+    selected_project = project_options[selected_project_name]
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        zoom = st.radio("Zoom", TIMELINE_ZOOM_LEVELS, index=1, horizontal=True)
+    with col2:
+        window_start = st.date_input("De", value=datetime.date.today() - timedelta(days=30))
+    with col3:
+        window_end = st.date_input("Até", value=datetime.date.today() + timedelta(days=90))
+    
+    if window_start > window_end:
+        st.error("❌ Data inicial não pode ser depois da final")
+        return
+    
+    # A janela é limitada para que o gráfico tenha no máximo TIMELINE_MAX_BUCKETS colunas
+    if count_timeline_buckets(window_start, window_end, zoom) > TIMELINE_MAX_BUCKETS:
+        first_key = timeline_bucket_keys([window_start], zoom)[0]
+        last_start = timeline_bucket_starts([first_key + TIMELINE_MAX_BUCKETS], zoom)[0]
+        window_end = (pd.Timestamp(last_start) - timedelta(days=1)).date()
+        st.warning(f"⚠️ Janela limitada a {TIMELINE_MAX_BUCKETS} períodos (até {window_end:%d/%m/%Y}). "
+                   f"Use um zoom maior para ver um intervalo mais longo.")
+    
+    timeline = get_timeline(selected_project, window_start, window_end, zoom)
+    
+    if timeline.empty:
+        st.info("Nenhuma tarefa no período selecionado")
+        return
+    
+    chart = alt.Chart(timeline).mark_rect().encode(
+        x=alt.X('period:T', title='Período'),
+        y=alt.Y('lane:N', title='Responsável'),
+        color=alt.Color('active_tasks:Q', title='Tarefas ativas', scale=alt.Scale(scheme='blues')),
+        tooltip=[alt.Tooltip('lane:N', title='Responsável'),
+                 alt.Tooltip('period:T', title='Início do período'),
+                 alt.Tooltip('active_tasks:Q', title='Tarefas ativas')]
+    )
+    st.altair_chart(chart, use_container_width=True)
+    st.caption(f"{timeline['lane'].nunique()} responsáveis, {len(timeline)} células no gráfico")
+
+def show_capacity():
+    """Carga prevista da equipe em todos os projetos e pessoas acima da capacidade"""
+    st.title("🧮 Capacidade da Equipe")
+    
+    start, user_ids, load, recomputed = refresh_capacity()
+    horizon_end = (start + np.timedelta64(CAPACITY_HORIZON_DAYS - 1, 'D')).astype(datetime.date)
+    today = start.astype(datetime.date)
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        projects = get_projects(st.session_state.user['id'], columns=['id', 'name'], include_templates=False)
+        project_options = {"Todos os projetos": None}
+        project_options.update({row['name']: row['id'] for _, row in projects.iterrows()})
+        selected_project = project_options[st.selectbox("Equipe do Projeto", list(project_options.keys()))]
+    with col2:
+        window_start = st.date_input("De", value=today, min_value=today, max_value=horizon_end)
+    with col3:
+        window_end = st.date_input("Até", value=today + timedelta(days=30), min_value=today, max_value=horizon_end)
+    
+    if window_start > window_end:
+        st.error("❌ Data inicial não pode ser depois da final")
+        return
+    
+    # A carga de cada pessoa soma todos os projetos; o filtro só escolhe quem aparece.
+    # As linhas partem dos ids calculados por refresh_capacity: quem foi cadastrado ou
+    # removido depois do cálculo fica de fora até a próxima atualização
+    user_index = pd.Index(user_ids)
+    users = get_users().set_index('id')
+    keep = user_index.isin(users.index)
+    if selected_project is not None:
+        members = get_project_members(selected_project)
+        keep &= user_index.isin(members['id'] if not members.empty else [])
+    rows = np.flatnonzero(keep)
+    users = users.loc[user_index[rows]]
+    
+    first = (np.datetime64(window_start, 'D') - start).astype(np.int64)
+    last = (np.datetime64(window_end, 'D') - start).astype(np.int64) + 1
+    window = load[rows, first:last]
+    workdays = np.is_busday(start + np.arange(first, last))
+    capacity = workdays.sum() * CAPACITY_HOURS_PER_DAY
+    
+    summary = pd.DataFrame({
+        'Pessoa': users['full_name'].to_numpy(),
+        'Horas Previstas': window.sum(axis=1).round(1),
+        'Capacidade (h)': capacity,
+        'Utilização (%)': (window.sum(axis=1) / capacity * 100).round(1) if capacity else 0.0,
+        'Dias Acima da Capacidade': (window > CAPACITY_HOURS_PER_DAY + 1e-6).sum(axis=1),
+        'Pico Diário (h)': window.max(axis=1, initial=0).round(1)
+    }).sort_values(['Utilização (%)', 'Dias Acima da Capacidade'], ascending=False)
+    overloaded = summary[summary['Utilização (%)'] > 100]
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Pessoas Sobrecarregadas", len(overloaded))
+    with col2:
+        st.metric("Utilização Média", f"{summary['Utilização (%)'].mean():.1f}%" if not summary.empty else "-")
+    with col3:
+        st.metric("Pessoas com Dias Acima da Capacidade", int((summary['Dias Acima da Capacidade'] > 0).sum()))
+    
+    if summary.empty:
+        st.info("Nenhuma pessoa na equipe selecionada")
+        return
+    
+    # Utilização semanal das pessoas mais carregadas
+    shown = np.argsort(-window.sum(axis=1), kind='stable')[:CAPACITY_MAX_USERS]
+    days = start + np.arange(first, last)
+    # 01/01/1970 foi uma quinta-feira: (dia + 3) % 7 é o deslocamento até a segunda-feira
+    mondays = days - (days.astype(np.int64) + 3) % 7
+    week_starts, week_index = np.unique(mondays, return_inverse=True)
+    weekly_hours = np.zeros((len(shown), len(week_starts)))
+    np.add.at(weekly_hours.T, week_index, window[shown].T)
+    weekly_capacity = np.bincount(week_index, weights=workdays) * CAPACITY_HOURS_PER_DAY
+    
+    # Semanas sem dia útil no período ficam fora do gráfico
+    user_rows, week_cols = np.nonzero(np.broadcast_to(weekly_capacity > 0, weekly_hours.shape))
+    heatmap = pd.DataFrame({
+        'user': users['full_name'].to_numpy()[shown][user_rows],
+        'week': pd.to_datetime(week_starts[week_cols]),
+        'hours': weekly_hours[user_rows, week_cols].round(1),
+        'utilization': weekly_hours[user_rows, week_cols] / weekly_capacity[week_cols]
+    })
+    
+    chart = alt.Chart(heatmap).mark_rect().encode(
+        x=alt.X('week:T', title='Semana'),
+        y=alt.Y('user:N', title='Pessoa', sort=list(users['full_name'].to_numpy()[shown])),
+        color=alt.Color('utilization:Q', title='Utilização', scale=alt.Scale(scheme='redyellowgreen', reverse=True,
+                                                                           domain=[0, 1.5], clamp=True)),
+        tooltip=[alt.Tooltip('user:N', title='Pessoa'),
+                 alt.Tooltip('week:T', title='Semana'),
+                 alt.Tooltip('hours:Q', title='Horas previstas'),
+                 alt.Tooltip('utilization:Q', title='Utilização', format='.0%')]
+    )
+    st.altair_chart(chart, use_container_width=True)
+    
+    st.subheader("👥 Carga por Pessoa")
+    st.dataframe(summary, use_container_width=True, hide_index=True)
+    st.caption(f"Esforço previsto de {TASK_HOURS_PER_DAY:g} h por dia útil de tarefa, menos as horas lançadas; "
+               f"capacidade de {CAPACITY_HOURS_PER_DAY:g} h por dia útil. "
+               f"{recomputed} de {len(user_ids)} linhas recalculadas nesta atualização.")
+
 def show_communication():
     """Sistema de comunicação"""
     st.title("💬 Comunicação")
     
-    projects = get_projects(st.session_state.user['id'])
+    projects = get_projects(st.session_state.user['id'], columns=['id', 'name'], include_templates=False)
     
     if not projects.empty:
         project_options = {row['name']: row['id'] for _, row in projects.iterrows()}
         selected_project_name = st.selectbox("Selecionar Projeto", list(project_options.keys()))
         selected_project = project_options[selected_project_name]
         
+        # Histórico de mensagens (o histórico já carregado fica no buffer da sessão)
+        st.subheader("📨 Histórico de Mensagens")
+        buffer = get_chat_buffer(selected_project)
+        
+        # Mensagens anteriores à janela carregada (inclusive as arquivadas)
+        if buffer['has_older']:
+            if st.button("⬆️ Carregar mensagens anteriores"):
+                load_older_messages(selected_project)
+        
+        for msg in buffer['messages']:
+            render_message(msg)
+        
+        # Apenas mensagens novas são consultadas e exibidas a cada atualização automática
+        buffer['rendered_count'] = len(buffer['messages'])
+        show_live_messages(selected_project)
+        
         # Enviar mensagem
         with st.form("message_form"):
             message = st.text_area("Mensagem")
@@ -946,26 +2912,6 @@ def show_communication():
                     st.rerun()
                 else:
                     st.error("Digite uma mensagem")
-        
-        # Histórico de mensagens
-        st.subheader("📨 Histórico de Mensagens")
-        conn = sqlite3.connect('scpe.db')
-        query = """SELECT m.*, u.full_name as from_user_name, p.name as project_name
-                   FROM messages m
-                   JOIN users u ON m.from_user = u.id
-                   JOIN projects p ON m.project_id = p.id
-                   WHERE m.project_id = ?
-                   ORDER BY m.created_at DESC"""
-        messages = pd.read_sql_query(query, conn, params=(selected_project,))
-        conn.close()
-        
-        if not messages.empty:
-            for _, msg in messages.iterrows():
-                st.write(f"**{msg['from_user_name']}** ({msg['created_at']}):")
-                st.write(f"{msg['message']}")
-                st.divider()
-        else:
-            st.info("Nenhuma mensagem neste projeto")
     else:
         st.info("Você não está em nenhum projeto")
 
@@ -973,7 +2919,9 @@ def show_reports():
     """Relatórios e análises"""
     st.title("📊 Relatórios e Análises")
     
-    projects = get_projects(st.session_state.user['id'])
+    projects = get_projects(st.session_state.user['id'],
+                            columns=['id', 'name', 'client', 'budget', 'total_deadline'],
+                            include_templates=False)
     
     if not projects.empty:
         project_options = {row['name']: row['id'] for _, row in projects.iterrows()}
@@ -983,8 +2931,11 @@ def show_reports():
         # Estatísticas do projeto
         st.subheader("📈 Estatísticas do Projeto")
         
-        tasks = get_tasks(selected_project)
-        members = get_project_members(selected_project)
+        # Todas as leituras do relatório vêm do mesmo snapshot somente leitura
+        with read_snapshot() as snapshot:
+            cumulative_flow, burndown, velocity = get_project_flow(selected_project, snapshot)
+            tasks = get_tasks(selected_project, columns=['status', 'assigned_to', 'hours_worked'], snapshot=snapshot)
+            members = get_project_members(selected_project, snapshot)
         project = projects[projects['id'] == selected_project].iloc[0]
         
         col1, col2, col3, col4 = st.columns(4)
@@ -1013,6 +2964,25 @@ def show_reports():
         else:
             st.info("Nenhuma tarefa para exibir")
         
+        # Evolução do projeto (séries pré-calculadas a partir do histórico de tarefas)
+        st.subheader("📉 Evolução do Projeto")
+        
+        if not cumulative_flow.empty:
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.write("**Burndown (tarefas restantes)**")
+                st.line_chart(burndown)
+            
+            with col2:
+                st.write("**Velocidade (tarefas concluídas por semana)**")
+                st.bar_chart(velocity)
+            
+            st.write("**Fluxo Cumulativo**")
+            st.area_chart(cumulative_flow)
+        else:
+            st.info("Nenhum histórico de tarefas para exibir")
+        
         # Tarefas por membro
         st.subheader("👥 Tarefas por Membro da Equipe")
         if not tasks.empty and not members.empty:
@@ -1061,11 +3031,17 @@ def show_admin():
     """Painel administrativo para gerentes"""
     st.title("⚙️ Painel Administrativo")
     
-    tab1, tab2, tab3 = st.tabs(["Usuários", "Todos os Projetos", "Estatísticas Gerais"])
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs(["Usuários", "Todos os Projetos", "Estatísticas Gerais",
+                                                        "Diagnóstico", "Backups", "Agendador", "Arquivo"])
+    
+    # Consultas das abas de leitura em um mesmo snapshot somente leitura
+    with read_snapshot() as snapshot:
+        users = get_users(snapshot)
+        all_projects = get_projects(snapshot=snapshot)  # Sem filtro de usuário
+        summary = get_system_summary(snapshot)
     
     with tab1:
         st.subheader("👥 Gerenciamento de Usuários")
-        users = get_users()
         
         if not users.empty:
             st.dataframe(users, use_container_width=True)
@@ -1074,7 +3050,6 @@ def show_admin():
     
     with tab2:
         st.subheader("📋 Todos os Projetos")
-        all_projects = get_projects()  # Sem filtro de usuário
         
         if not all_projects.empty:
             st.dataframe(all_projects, use_container_width=True)
@@ -1084,27 +3059,48 @@ def show_admin():
     with tab3:
         st.subheader("📈 Estatísticas Gerais")
         
-        users = get_users()
-        projects = get_projects()
-        tasks = get_tasks()
-        
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.metric("Total de Usuários", len(users))
-            st.metric("Gerentes", len(users[users['role'] == 'gerente']))
-            st.metric("Membros", len(users[users['role'] == 'membro']))
-        
-        with col2:
-            st.metric("Total de Projetos", len(projects))
-            st.metric("Projetos Ativos", len(projects[projects['status'] == 'ativo']))
-            st.metric("Orçamento Total", f"R$ {projects['budget'].sum():,.2f}")
+        # Totais pré-calculados pelo agendador
+        if summary['updated_at']:
+            col1, col2, col3 = st.columns(3)
+            
+            with col1:
+                st.metric("Total de Usuários", int(summary['total_users']))
+                st.metric("Gerentes", int(summary['managers']))
+                st.metric("Membros", int(summary['members']))
+            
+            with col2:
+                st.metric("Total de Projetos", int(summary['total_projects']))
+                st.metric("Projetos Ativos", int(summary['active_projects']))
+                st.metric("Orçamento Total", f"R$ {summary['total_budget']:,.2f}")
+            
+            with col3:
+                st.metric("Total de Tarefas", int(summary['total_tasks']))
+                st.metric("Tarefas Concluídas", int(summary['completed_tasks']))
+                overall_completion = (summary['completed_tasks'] / summary['total_tasks'] * 100) if summary['total_tasks'] > 0 else 0
+                st.metric("Média Conclusão", f"{overall_completion:.1f}%")
+            
+            st.caption(f"Última alteração em {summary['updated_at']}")
+        else:
+            st.info("Estatísticas ainda não calculadas pelo agendador")
+
+    with tab4:
+        st.subheader("🩺 Diagnóstico do Banco de Dados")
         
-        with col3:
-            st.metric("Total de Tarefas", len(tasks))
-            st.metric("Tarefas Concluídas", len(tasks[tasks['status'] == 'concluída']))
-            overall_completion = (len(tasks[tasks['status'] == 'concluída']) / len(tasks) * 100) if len(tasks) > 0 else 0
-            st.metric("Média Conclusão", f"{overall_completion:.1f}%")
+        # Carregado apenas quando solicitado
+        if st.toggle("Carregar diagnóstico"):
+            show_diagnostics()
+    
+    with tab5:
+        st.subheader("💾 Backups e Restauração")
+        show_backups()
+    
+    with tab6:
+        st.subheader("⏲️ Tarefas Agendadas")
+        show_scheduler()
+    
+    with tab7:
+        st.subheader("🗄️ Arquivo de Mensagens")
+        show_message_archive()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file